@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Store of the wave energy of a spectrum, replayed instead of being computed again
+
+The energy Ex (nf, nx) computed by WaveSpec.calcExt only depends on the spectrum, the domain,
+the ice and the time, not on the phases of the waves: the repeats of an experiment, which only
+differ by their phases, compute the same energies at the same times as long as their ice is the same.
+With fractures, the energy changes: the ice of a configuration is then that of the fractured floes
+(or, as an approximation, the ice cover with the fractures ignored, cf WaveSpec.useEnvelopes).
+Energies are grouped by configuration (spectrum, domain and ice, cf WaveSpec.envelopeConfig),
+each group being a (nt, nf, nx) array, kept in memory or memory-mapped in a .npy file.
+The store is bounded in size: the least recently used configurations are dropped first (once a floe
+has fractured, the configurations of the earlier floes are usually not met again).
+"""
+
+import os
+from collections import OrderedDict
+import numpy as np
+
+
+class EnvelopeBlock(object):
+    """ Energies of a configuration at the times it was computed for
+    Inputs: shape: (nf, nx) shape of the energy at one time
+    Optional:   fname: .npy file the energies are memory-mapped to (in memory if None)
+    """
+
+    def __init__(self, shape, fname=None):
+        self.shape = shape
+        self.fname = fname
+        self.times = {}
+        self.data = None
+        self.data = self.allocate(16)
+
+    def allocate(self, capacity):
+        # Array for the energies at capacity times, with the energies already stored
+        if self.fname is None:
+            data = np.empty((capacity,) + self.shape)
+        else:
+            data = np.lib.format.open_memmap(self.fname + '.tmp', mode='w+', dtype=np.float64,
+                                             shape=(capacity,) + self.shape)
+        if self.data is not None:
+            data[:len(self.data)] = self.data
+        if self.fname is not None:
+            os.replace(self.fname + '.tmp', self.fname)
+        return data
+
+    def get(self, t):
+        if t not in self.times:
+            return None
+        return np.array(self.data[self.times[t]])
+
+    def put(self, t, Ex):
+        if t not in self.times:
+            if len(self.times) == len(self.data):
+                self.data = self.allocate(2 * len(self.data))
+            self.times[t] = len(self.times)
+        self.data[self.times[t]] = Ex
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def release(self):
+        # Frees the energies, and removes their file if memory-mapped
+        self.data = None
+        self.times = {}
+        if self.fname is not None and os.path.exists(self.fname):
+            os.remove(self.fname)
+
+
+class EnvelopeStore(object):
+    """ Energies of a spectrum for several configurations (cf EnvelopeBlock), shared by the
+    experiments using the same spectrum (cf WaveSpec.useEnvelopes)
+    Optional:   directory: directory where the energies are memory-mapped (kept in memory if None)
+                maxbytes: maximum size of the stored energies, the least recently used
+                          configurations being dropped beyond it (the last one used is always kept)
+    """
+
+    def __init__(self, directory=None, maxbytes=2**30):
+        self.directory = directory
+        self.maxbytes = maxbytes
+        self.blocks = OrderedDict()
+        self.nFiles = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __repr__(self):
+        return(f'EnvelopeStore object ({len(self.blocks)} configurations, {self.nbytes / 2**20:.1f} MiB, '
+               f'hits: {self.hits}, misses: {self.misses})')
+
+    def __len__(self):
+        return len(self.blocks)
+
+    @staticmethod
+    def timeKey(t):
+        return float(f'{t:.12g}')
+
+    def get(self, config, t):
+        ''' Energy of the configuration config at time t, None if it was not stored '''
+        block = self.blocks.get(config)
+        Ex = None
+        if block is not None:
+            self.blocks.move_to_end(config)
+            Ex = block.get(self.timeKey(t))
+        if Ex is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return Ex
+
+    def put(self, config, t, Ex):
+        # Stores the energy Ex of the configuration config at time t
+        if config not in self.blocks:
+            fname = None
+            if self.directory is not None:
+                fname = os.path.join(self.directory, f'Envelope_{self.nFiles:04}.npy')
+                self.nFiles += 1
+            self.blocks[config] = EnvelopeBlock(Ex.shape, fname=fname)
+        self.blocks.move_to_end(config)
+        self.blocks[config].put(self.timeKey(t), Ex)
+        self.evict()
+
+    @property
+    def nbytes(self):
+        return sum(block.nbytes for block in self.blocks.values())
+
+    def evict(self):
+        # Drops the least recently used configurations while the store is larger than maxbytes
+        nbytes = self.nbytes
+        while nbytes > self.maxbytes and len(self.blocks) > 1:
+            _, block = self.blocks.popitem(last=False)
+            nbytes -= block.nbytes
+            block.release()
+            self.evictions += 1
+
+    def resize(self, maxbytes):
+        self.maxbytes = maxbytes
+        self.evict()
+
+    def stats(self):
+        # Returns the usage statistics of the store
+        calls = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': self.hits / calls if calls > 0 else 0.,
+                'configurations': len(self.blocks),
+                'times': sum(len(block.times) for block in self.blocks.values()),
+                'nbytes': self.nbytes,
+                'maxbytes': self.maxbytes,
+                'evictions': self.evictions}
+
+    def clear(self):
+        for block in self.blocks.values():
+            block.release()
+        self.blocks.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
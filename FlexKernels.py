@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Kernels of the floe computations, with interchangeable backends
+
+The small array operations done for each floe (curvature, rotation free gradient, strain,
+mean sea level under the floe, energy integral) and the pentadiagonal solve of the flexural
+operator are grouped in a backend:
+    - 'numpy': the NumPy (and LAPACK for the solve) implementations, always available
+    - 'numba': fused loops compiled by numba, only if numba is installed
+The backend is 'numpy' unless set otherwise in pars (FlexBackend), and can be changed at runtime
+with setBackend. Note: the numba LU does not pivot, and its compiled kernels are cached next to
+the sources (__pycache__).
+Note: flexural operators are factorized by the backend selected when they are built (cf FlexOperator)
+"""
+
+import numpy as np
+from scipy.linalg.lapack import dgbtrf, dgbtrs
+import pars
+
+try:
+    from numba import njit
+    hasNumba = True
+except ImportError:
+    hasNumba = False
+
+# Number of sub- and super-diagonals of the pentadiagonal operators
+kl = 2
+ku = 2
+
+
+class Kernels(object):
+    """ Set of kernels of a backend
+    Inputs: name:   name of the backend
+            kernels (keywords): the functions of the backend
+                curv(w, dx):            second derivative of w, 0 at the edges
+                du(w, x):               rotation free gradient of w and the removed mean slope
+                strain(w, dx, h):       strain at the top and bottom of the floe
+                mslfInt(wv, x):         mean of the waves wv under the floe
+                trapz2(intV, dx):       trapezoidal integral of intV**2
+                pentaFactor(bands):     LU factorization of the operator given by its five bands
+                                        (bands[ku + i - j, j] = A[i, j]) -> (factors, info)
+                pentaSolve(factors, b): solution of A w = b, for b of shape (N,) or (N, nRHS)
+    """
+
+    def __init__(self, name, **kernels):
+        self.name = name
+        for key, kernel in kernels.items():
+            setattr(self, key, kernel)
+
+    def __repr__(self):
+        return(f'Kernels object ({self.name})')
+
+
+# NumPy backend
+def curv_numpy(w, dx):
+    d2w = np.zeros(len(w))
+    d2w[1:-1] = (w[:-2] - 2 * w[1:-1] + w[2:])
+    return d2w / (dx**2)
+
+
+def du_numpy(w, x):
+    dx = x[1] - x[0]
+    dw = np.zeros(len(w))
+    dw[0]  = (-3 * w[0]  + 4 * w[1]  - w[2])
+    dw[-1] = ( 3 * w[-1] - 4 * w[-2] + w[-3])
+    dw[1:-1] = (-w[:-2] + w[2:])
+    dw = dw / (2 * dx)
+
+    # Remove constant dwdx from the set, to account for rotation of the floe
+    fit = np.polyfit(x, dw, 0)
+    return dw - fit[0], fit[0]
+
+
+def strain_numpy(w, dx, h):
+    return h * curv_numpy(w, dx) / 2
+
+
+def mslfInt_numpy(wv, x):
+    return (wv[:-1].sum() + wv[1:].sum()) * (x[1] - x[0]) / (2 * (x[-1] - x[0]))
+
+
+def trapz2_numpy(intV, dx):
+    return (intV[0]**2 / 2 + intV[-1]**2 / 2 + (intV[1:-1]**2).sum()) * dx
+
+
+def pentaFactor_numpy(bands):
+    # LAPACK banded LU needs kl extra rows to store the fill-in of the pivoting
+    ab = np.zeros((2 * kl + ku + 1, bands.shape[1]))
+    ab[kl:] = bands
+    lu, piv, info = dgbtrf(ab, kl, ku)
+    return (lu, piv), info
+
+
+def pentaSolve_numpy(factors, b):
+    lu, piv = factors
+    w, info = dgbtrs(lu, kl, ku, b, piv)
+    if info < 0:
+        raise ValueError(f'Wrong argument {-info} for the banded solve')
+    return w
+
+
+Backends = {'numpy': Kernels('numpy', curv=curv_numpy, du=du_numpy, strain=strain_numpy,
+                             mslfInt=mslfInt_numpy, trapz2=trapz2_numpy,
+                             pentaFactor=pentaFactor_numpy, pentaSolve=pentaSolve_numpy)}
+
+
+# numba backend
+if hasNumba:
+    @njit(cache=True)
+    def curv_numba(w, dx):
+        N = len(w)
+        d2w = np.zeros(N)
+        for i in range(1, N - 1):
+            d2w[i] = (w[i - 1] - 2 * w[i] + w[i + 1]) / (dx**2)
+        return d2w
+
+    @njit(cache=True)
+    def du_numba(w, x):
+        N = len(w)
+        dx = x[1] - x[0]
+        dw = np.empty(N)
+        dw[0]  = (-3 * w[0]  + 4 * w[1]  - w[2]) / (2 * dx)
+        dw[-1] = ( 3 * w[-1] - 4 * w[-2] + w[-3]) / (2 * dx)
+        for i in range(1, N - 1):
+            dw[i] = (-w[i - 1] + w[i + 1]) / (2 * dx)
+        slope = dw.mean()
+        return dw - slope, slope
+
+    @njit(cache=True)
+    def strain_numba(w, dx, h):
+        return h * curv_numba(w, dx) / 2
+
+    @njit(cache=True)
+    def mslfInt_numba(wv, x):
+        total = 0.
+        for i in range(len(wv) - 1):
+            total += wv[i] + wv[i + 1]
+        return total * (x[1] - x[0]) / (2 * (x[-1] - x[0]))
+
+    @njit(cache=True)
+    def trapz2_numba(intV, dx):
+        total = (intV[0]**2 + intV[-1]**2) / 2
+        for i in range(1, len(intV) - 1):
+            total += intV[i]**2
+        return total * dx
+
+    @njit(cache=True)
+    def pentaFactor_jit(bands):
+        # LU without pivoting, stable here since the flexural operator is similar to a
+        # symmetric positive definite matrix through a diagonal scaling (cf FlexOperator.EigenFlex)
+        lu = bands.copy()
+        N = lu.shape[1]
+        for k in range(N):
+            pivot = lu[ku, k]
+            if pivot == 0:
+                return lu, k + 1
+            for i in range(k + 1, min(k + kl + 1, N)):
+                lik = lu[ku + i - k, k] / pivot
+                lu[ku + i - k, k] = lik
+                for j in range(k + 1, min(k + ku + 1, N)):
+                    lu[ku + i - j, j] -= lik * lu[ku + k - j, j]
+        return lu, 0
+
+    @njit(cache=True)
+    def pentaSolve_jit(lu, b):
+        N, nRHS = b.shape
+        w = b.copy()
+        for r in range(nRHS):
+            for i in range(1, N):
+                for j in range(max(0, i - kl), i):
+                    w[i, r] -= lu[ku + i - j, j] * w[j, r]
+            for i in range(N - 1, -1, -1):
+                for j in range(i + 1, min(N, i + ku + 1)):
+                    w[i, r] -= lu[ku + i - j, j] * w[j, r]
+                w[i, r] /= lu[ku, i]
+        return w
+
+    def pentaFactor_numba(bands):
+        return pentaFactor_jit(np.ascontiguousarray(bands, dtype=np.float64))
+
+    def pentaSolve_numba(factors, b):
+        b = np.asarray(b, dtype=np.float64)
+        w = pentaSolve_jit(factors, b.reshape(b.shape[0], -1))
+        return w.reshape(b.shape)
+
+    Backends['numba'] = Kernels('numba', curv=curv_numba, du=du_numba, strain=strain_numba,
+                                mslfInt=mslfInt_numba, trapz2=trapz2_numba,
+                                pentaFactor=pentaFactor_numba, pentaSolve=pentaSolve_numba)
+
+Backend = Backends['numpy']
+
+
+def setBackend(name):
+    # Selects the backend of the kernels ('numpy' or 'numba')
+    global Backend
+    if name not in Backends:
+        if name == 'numba':
+            raise ValueError('The numba backend needs numba to be installed')
+        raise ValueError(f'Unknown kernels backend: {name}')
+    Backend = Backends[name]
+
+
+def getKernels():
+    # Returns the kernels of the selected backend
+    return Backend
+
+
+# Backend of pars files that do not set it (eg written by GenExp): numpy
+setBackend(getattr(pars, 'FlexBackend', 'numpy'))
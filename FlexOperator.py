@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Banded representation of the flexural operator of a floe
+
+The operator (E * I / dx**4) * D + rho_w * g * Id, with D the finite difference
+stencil of the fourth derivative used in IceDef, is pentadiagonal: only its five
+diagonals are stored and it is solved with a banded LU factorization.
+Note: D is not symmetric (rows next to the edges), hence LU and not Cholesky.
+Factorized operators are shared by all floes through an LRU cache (getFlexCache).
+For the most common number of points (101, cf pars.Deriv101), D is instead decomposed once
+in its eigenbasis (EigenFlex), where the operator is diagonal for any dx, h or E.
+"""
+
+from collections import OrderedDict
+import numpy as np
+from pars import g, rho_w, E, v
+from ElasticMaterials import Lame
+# Number of sub- and super-diagonals of the operator, and the factorization/solve kernels
+from FlexKernels import getKernels, kl, ku
+
+
+def FlexBands(N):
+    ''' Returns the fourth derivative stencil D (without the 1/dx**4 factor) in banded storage
+    Input: N (int): number of points of the floe
+    Output: bands (np.array, (5, N)): bands[ku + i - j, j] = D[i, j]
+    '''
+    C0 = np.ones(N)
+    bands = np.array([C0, -4 * C0, 6 * C0, -4 * C0, C0])
+
+    # First two rows can't use centered difference
+    # -> D[0, [0, 1, 2]] = [2, -4, 2] and D[1, [0, 1, 2, 3]] = [-2, 5, -4, 1]
+    bands[[2, 1, 0], [0, 1, 2]] = np.array([2, -4, 2])
+    bands[[3, 2, 1, 0], [0, 1, 2, 3]] = np.array([-2, 5, -4, 1])
+
+    # Last two rows can't use centered difference either
+    # -> D[-1, [-3, -2, -1]] = [2, -4, 2] and D[-2, [-4, -3, -2, -1]] = [1, -4, 5, -2]
+    bands[[4, 3, 2], [N - 3, N - 2, N - 1]] = np.array([2, -4, 2])
+    bands[[4, 3, 2, 1], [N - 4, N - 3, N - 2, N - 1]] = np.array([1, -4, 5, -2])
+
+    return bands
+
+
+def bandsToArray(bands):
+    # Dense version of a matrix given in banded storage (cf FlexBands)
+    N = bands.shape[1]
+    A = np.zeros((N, N))
+    for k in range(-kl, ku + 1):
+        i = np.arange(max(0, -k), min(N, N - k))
+        A[i, i + k] = bands[ku - k, i + k]
+    return A
+
+
+class BandedFlex(object):
+    """ LU factorized flexural operator stored as five diagonals
+    (factorized and solved by the kernels backend selected when it is built, cf FlexKernels)
+    Inputs: N:  number of points of the floe
+            dx: spacing between points (m)
+            I:  flexural inertia of the floe, h**3 / (12 * (1 - v**2))
+    Optional:   E: elastic modulus (Pa)
+    """
+
+    def __init__(self, N, dx, I, E=E):
+        self.N = N
+        self.dx = dx
+        self.I = I
+        self.E = E
+
+        bands = (E * I / dx**4) * FlexBands(N)
+        bands[ku] += rho_w * g
+
+        # Note: a singular operator is only reported when solving, so that callers can fall back
+        self.kernels = getKernels()
+        self.factors, self.info = self.kernels.pentaFactor(bands)
+
+    def __repr__(self):
+        return(f'BandedFlex object ({self.N}, {self.dx:.4f}, {self.I:.4f})')
+
+    def solve(self, b):
+        ''' Solves A w = b
+        Input: b (np.array): right-hand side(s), of shape (N,) or (N, nRHS)
+        Output: w (np.array): solution(s), same shape as b
+        '''
+        if self.info > 0:
+            raise np.linalg.LinAlgError(f'Singular flexural operator (U[{self.info - 1}, {self.info - 1}] = 0)')
+        return self.kernels.pentaSolve(self.factors, b)
+
+    def toarray(self):
+        # Dense version of the operator, only meant for diagnostics and fallbacks
+        bands = (self.E * self.I / self.dx**4) * FlexBands(self.N)
+        bands[ku] += rho_w * g
+        return bandsToArray(bands)
+
+
+class EigenFlex(object):
+    """ Eigen decomposition of the fourth derivative stencil D of N points
+    D is similar to a symmetric matrix: D = S^-1 Q diag(lam) Q^T S,
+    with S = diag(1/sqrt(2), 1, ..., 1, 1/sqrt(2)) and Q orthogonal,
+    so that (E * I / dx**4) * D + rho_w * g * Id is inverted by a scaling in the basis Q
+    Inputs: N:  number of points of the floes
+    """
+
+    def __init__(self, N):
+        self.N = N
+
+        D = bandsToArray(FlexBands(N))
+
+        self.s = np.ones(N)
+        self.s[[0, -1]] = 1 / np.sqrt(2)
+        Dsym = self.s[:, None] * D / self.s[None, :]
+        Dsym = (Dsym + Dsym.T) / 2
+
+        # Constant and linear deformations are exactly in the kernel of D: they are
+        # set apart so that the corresponding eigenvalues are exactly 0
+        Z = np.linalg.qr(np.column_stack([self.s, self.s * np.arange(N), np.eye(N)]))[0]
+        lam, U = np.linalg.eigh(Z[:, 2:].T @ Dsym @ Z[:, 2:])
+        self.Q = np.column_stack([Z[:, :2], Z[:, 2:] @ U])
+        self.lam = np.concatenate([[0, 0], lam])
+
+        # Deformation modes and their curvature (cf Floe.calc_curv)
+        # and rotation free gradient (cf Floe.calc_du), without the dx factors
+        modes = self.Q / self.s[:, None]
+        self.curvModes = np.zeros((N, N))
+        self.curvModes[1:-1] = modes[:-2] - 2 * modes[1:-1] + modes[2:]
+        grad = np.zeros((N, N))
+        grad[0]  = (-3 * modes[0]  + 4 * modes[1]  - modes[2])
+        grad[-1] = ( 3 * modes[-1] - 4 * modes[-2] + modes[-3])
+        grad[1:-1] = (-modes[:-2] + modes[2:])
+        self.gradModes = (grad - grad.mean(axis=0)) / 2
+
+    def __repr__(self):
+        return(f'EigenFlex object ({self.N})')
+
+    def coefs(self, b, dx, I, E=E):
+        ''' Coefficients in the basis Q of the displacements solving A w = b
+        Inputs: b (np.array): right-hand side(s), of shape (N,) or (N, nRHS)
+                dx, I (float or np.array of nRHS floats): spacing and inertia of each floe
+        Output: y (np.array, (N, nRHS)): coefficients
+        '''
+        scale = (E * np.asarray(I) / np.asarray(dx)**4) * self.lam[:, None] + rho_w * g
+        return (self.Q.T @ (self.s[:, None] * b.reshape(self.N, -1))) / scale
+
+    def solve(self, b, dx, I, E=E):
+        # Solves A w = b (cf coefs), w having the shape of b
+        w = (self.Q @ self.coefs(b, dx, I, E=E)) / self.s[:, None]
+        return w.reshape(b.shape)
+
+    def integrands(self, b, dx, h, EType='Flex', E=E):
+        ''' Integrands of the elastic energies of the floes deformed by the forcings b, without computing w
+        Inputs: b (np.array, (N, nRHS)): right-hand sides
+                dx (np.array): spacing between the points of each floe
+                h (float): thickness of the floes
+                EType (str): 'Flex' or 'Disp' (cf Floe.calc_Eel)
+        Outputs: intV (np.array, (N, nRHS)): curvature or rotation free gradient of each floe
+                 prefac (float): energy = prefac * integral of intV**2
+        '''
+        I = h**3 / (12 * (1 - v**2))
+        y = self.coefs(b, dx, I, E=E)
+        if EType == 'Disp':
+            intV = (self.gradModes @ y) / dx
+            (l, u) = Lame(E, v)
+            prefac = u
+        elif EType == 'Flex':
+            intV = (self.curvModes @ y) / dx**2
+            prefac = (1 / 2) * E * I / h
+
+        return intV, prefac
+
+    def energies(self, b, dx, dxs, h, EType='Flex', E=E):
+        # Elastic energies of the floes deformed by the forcings b (cf integrands),
+        # dxs being the resolution of each floe (integration step)
+        intV, prefac = self.integrands(b, dx, h, EType=EType, E=E)
+
+        int2 = (intV[0]**2 / 2 + intV[-1]**2 / 2 + (intV[1:-1]**2).sum(axis=0)) * dxs
+
+        return prefac * int2
+
+    def operator(self, dx, I, E=E):
+        # Returns the operator of a floe of spacing dx and inertia I
+        return EigenFlexOperator(self, dx, I, E=E)
+
+
+class EigenFlexOperator(object):
+    """ Flexural operator of a floe, solved in the eigenbasis of its stencil (same interface as BandedFlex)
+    Inputs: eigen:  EigenFlex decomposition for the number of points of the floe
+            dx, I:  spacing and inertia of the floe
+    """
+
+    def __init__(self, eigen, dx, I, E=E):
+        self.eigen = eigen
+        self.N = eigen.N
+        self.dx = dx
+        self.I = I
+        self.E = E
+
+    def __repr__(self):
+        return(f'EigenFlexOperator object ({self.N}, {self.dx:.4f}, {self.I:.4f})')
+
+    def solve(self, b):
+        return self.eigen.solve(b, self.dx, self.I, E=self.E)
+
+    def toarray(self):
+        return BandedFlex(self.N, self.dx, self.I, E=self.E).toarray()
+
+
+# Numbers of points for which operators are solved in the eigenbasis of their stencil
+EigenSizes = {101}
+EigenDecompositions = {}
+
+
+def setEigenSizes(sizes):
+    # Sets the numbers of points solved in the eigenbasis (empty for banded solves only)
+    global EigenSizes
+    EigenSizes = set(sizes)
+    FlexOperators.clear()
+
+
+def getEigenFlex(N):
+    # Returns the eigen decomposition of the stencil of N points, or None if not in use for N
+    if N not in EigenSizes:
+        return None
+    if N not in EigenDecompositions:
+        EigenDecompositions[N] = EigenFlex(N)
+    return EigenDecompositions[N]
+
+
+class FlexCache(object):
+    """ Size-bounded LRU cache of factorized flexural operators, shared by all floes
+    Operators are keyed on (N, dx, h, E), dx being rounded to 12 significant digits so that
+    floes built from slightly different floating point lengths share their operator
+    Optional:   maxsize: maximum number of operators kept in memory
+    """
+
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self.operators = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return(f'FlexCache object ({len(self.operators)}/{self.maxsize}, '
+               f'hits: {self.hits}, misses: {self.misses})')
+
+    def __len__(self):
+        return len(self.operators)
+
+    @staticmethod
+    def key(N, dx, h, E=E):
+        return (int(N), float(f'{dx:.12g}'), float(h), float(E))
+
+    def get(self, N, dx, h, E=E):
+        ''' Returns the factorized operator for a floe of N points, spacing dx and thickness h
+        The operator is built and factorized only if it is not already in the cache
+        '''
+        key = self.key(N, dx, h, E)
+        if key in self.operators:
+            self.hits += 1
+            self.operators.move_to_end(key)
+            return self.operators[key]
+
+        self.misses += 1
+        I = h**3 / (12 * (1 - v**2))
+        eigen = getEigenFlex(N)
+        if eigen is None:
+            operator = BandedFlex(N, dx, I, E=E)
+        else:
+            operator = eigen.operator(dx, I, E=E)
+        self.operators[key] = operator
+        if len(self.operators) > self.maxsize:
+            self.operators.popitem(last=False)
+        return operator
+
+    def stats(self):
+        # Returns the usage statistics of the cache
+        calls = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': self.hits / calls if calls > 0 else 0.,
+                'size': len(self.operators),
+                'maxsize': self.maxsize}
+
+    def resize(self, maxsize):
+        self.maxsize = maxsize
+        while len(self.operators) > self.maxsize:
+            self.operators.popitem(last=False)
+
+    def clear(self):
+        self.operators.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+FlexOperators = FlexCache()
+
+
+def getFlexCache():
+    # Returns the process-wide cache of flexural operators
+    return FlexOperators
@@ -12,6 +12,7 @@ import config
 from treeForFrac import getFractureHistory
 from pars import E, v, rho_w, g, strainCrit
 from IceDef import Floe
+from FloeField import FloeField
 
 
 def calc_xstar(In, **kwargs):
@@ -122,10 +123,14 @@ def PlotFloes(x, t, Floes, wave, *args):
 
 
 def PlotFracE(floe, Eel_floes):
+    # Eel_floes: energy landscape given by Floe.computeFracEnergies,
+    #            or list of energies given by Floe.FindE_minVerbose
     fig, hax = plt.subplots()
     x = floe.xF[1:-1] - floe.x0
 
-    if type(Eel_floes) is list:
+    if type(Eel_floes) is tuple:
+        Eel_floes = np.column_stack(Eel_floes[:2])
+    elif type(Eel_floes) is list:
         nF = len(Eel_floes[1])
         Etemp = np.zeros((nF, 2))
         for iF in range(nF):
@@ -197,26 +202,38 @@ def PlotSum(t, y, **kwargs):
     return(fig, hax)
 
 
-def BreakFloes(x, t, Floes, wave, multiFrac=True, *args):
+def BreakFloes(x, t, Floes, wave, multiFrac=True, *args, energyBound=False, maxFrac=None, tol=None):
     '''
         Searches if a fracture can occur and where would it be
     ----------
     x : np.array -> mesh of the scene
     t : float -> time of simulation
-    Floes : list(Floe) -> current floes list (order from left to right)
+    Floes : list(Floe) or FloeField -> current floes (order from left to right)
     wave : Wave class -> wave
     multiFrac: boolean -> determines if more than one fracture should be considered
     *args :
         Etype: string -> energy type among 'Flex' and 'Disp'
+    energyBound: boolean -> skips the floes whose energy is bounded below their fracture energy
+                            (cf Floe.calc_Eel_bound): the bound is then in floe.EelBound, floe.Eel
+                            is nan and floe.w is removed (cf Floe.setEelBound). False (default)
+                            to compute the energy and displacement of all floes
+    maxFrac: int -> maximum number of simultaneous fractures of a floe, None for no limit, 0 for no fracture
+    tol: float -> tolerance (m) on the fracture positions, refined between the points of the floes
+                  (cf Floe.refineFractures), None to keep the fractures at the points of the floes
 
     Returns
     -------
-    Floes : list(Floe) -> updated list of floes, still in order from left to right
+    Floes : FloeField -> updated floes, still in order from left to right
     '''
 
     EType = args[0] if len(args) > 0 else 'Flex'
     Spec = (wave.type == 'WaveSpec')
 
+    if isinstance(Floes, FloeField):
+        Floes.update()
+    else:
+        Floes = FloeField(Floes)
+
     Broke = True
     nFrac = 0
 
@@ -224,54 +241,56 @@ def BreakFloes(x, t, Floes, wave, multiFrac=True, *args):
 
         Broke = False
 
-        # Computes Elastic Energy and break Floes
-        NewFloes = Floes.copy()
-        Offset = 0
-        Etot = 0
-        for iF in range(len(Floes)):
-            if Spec:
-                wvf = wave.calc_waves(Floes[iF].xF)
-            else:
-                wvf = wave.waves(Floes[iF].xF, t, amp=Floes[iF].a0,
-                                 phi=Floes[iF].phi0, floes=[Floes[iF]])
-            Eel1 = Floes[iF].calc_Eel(EType=EType, wvf=wvf)
-
-            # Check if it is worth looking for fractures
-            maxFrac = Floes[iF].Eel / Floes[iF].k
-            if maxFrac > 1:
-
-                xFracs, floes, Etot_floes = \
-                    Floes[iF].FindE_min(wave, t, EType=EType, multiFrac=(multiFrac and maxFrac > 2))
-
-                if Etot_floes < Eel1:
-                    Broke = True
-
-                    # # Show energy and strain if it would break
-                    # xf, _, _, E_lists = Floes[iF].FindE_minVerbose(1, wave, t, EType=EType, V=True)
-                    # PlotFracE(Floes[iF], E_lists)
-
-                    # Add event to fracture history
-                    getFractureHistory().addChildren(Floes[iF], floes, t)
-
-                    # Modify list of floes
-                    nFrac += len(xFracs)
-                    NewFloes[iF + Offset] = floes[0]
-                    for k in range(1, len(xFracs) + 1):
-                        Offset += 1
-                        NewFloes.insert(iF + Offset, floes[k])
-                    Etot += Etot_floes
-                else:
-                    Etot += Eel1
-            else:
-                Etot += Eel1
+        # Computes Elastic Energy of all floes
+        # (spectral waves only depend on position: computed at once on the points of all floes,
+        # the floes that did not break keeping the waves of the previous iteration, cf calc_waves)
+        if Spec:
+            wvfs = wave.calc_wavesSets([floe.xF for floe in Floes])
+        for iF, floe in enumerate(Floes):
+            wvf = wvfs[iF] if Spec else None
+            # Floes that can't pay for a fracture are not solved for
+            if energyBound:
+                bound = floe.calc_Eel_bound(wvf=wvf, EType=EType)
+                if bound < floe.k:
+                    floe.setEelBound(bound)
+                    continue
+            if not Spec:
+                wvf = wave.waves(floe.xF, t, amp=floe.a0, phi=floe.phi0, floes=[floe])
+            floe.calc_Eel(EType=EType, wvf=wvf)
+        Floes.update()
+        Etot = np.nansum(Floes.Eel)
+
+        # Break floes where it is worth looking for fractures (none if fractures are not allowed)
+        fractured = {}
+        for iF in (Floes.canBreak() if maxFrac != 0 else []):
+            # Several fractures only if the energy of the floe could pay for them, and if allowed
+            multiFracFloe = multiFrac and Floes.Eel[iF] / Floes.k[iF] > 2 and (maxFrac is None or maxFrac > 1)
+            Eel1 = Floes.Eel[iF]
+
+            xFracs, floes, Etot_floes = \
+                Floes[iF].FindE_min(wave, t, EType=EType, multiFrac=multiFracFloe, maxFrac=maxFrac, tol=tol)
+
+            if Etot_floes < Eel1:
+                Broke = True
+
+                # # Show energy and strain if it would break
+                # PlotFracE(Floes[iF], Floes[iF].computeFracEnergies(wave, t, EType=EType))
+
+                # Add event to fracture history, which keeps the broken floe: its memo is not needed anymore
+                getFractureHistory().addChildren(Floes[iF], floes, t)
+                Floes[iF].releaseEnergyForms()
+
+                # Floes are replaced all at once at the end of the loop
+                nFrac += len(xFracs)
+                fractured[iF] = floes
+                Etot += Etot_floes - Eel1
 
         if Broke:
-            Floes = NewFloes
+            Floes.replace(fractured)
         else:
             for floe in Floes:
                 if floe.Eel > 10 * floe.k:
-                    xf, _, _, E_lists = floe.FindE_minVerbose(1, wave, t, EType=EType, V=True)
-                    PlotFracE(floe, E_lists)
+                    PlotFracE(floe, floe.computeFracEnergies(wave, t, EType=EType))
             break
 
     return Floes
@@ -284,6 +303,11 @@ def BreakFloesStrain(x, t, Floes, wave):
 
     Spec = True if wave.type == 'WaveSpec' else False
 
+    if isinstance(Floes, FloeField):
+        Floes.update()
+    else:
+        Floes = FloeField(Floes)
+
     # Note: in the code, the nergy is computed with calc_Eel since it also computed displacement
     Broke = True
     nFrac = 0
@@ -291,13 +315,17 @@ def BreakFloesStrain(x, t, Floes, wave):
     while Broke:
 
         Broke = False
-        NewFloes = Floes.copy()
-        Offset = 0
+        fractured = {}
+
+        # Spectral waves only depend on position: computed at once on the points of all floes
+        if Spec:
+            wvfs = wave.calc_wavesSets([floe.xF for floe in Floes])
+
         for iF in range(len(Floes)):
 
             # Compute displacement
             if Spec:
-                wvf = wave.calc_waves(Floes[iF].xF)
+                wvf = wvfs[iF]
             else:
                 # Computes the wave amplitude and information along the floe
                 a_vec = wave.amp_att(Floes[iF].xF, Floes[iF].a0, [Floes[iF]])
@@ -327,13 +355,15 @@ def BreakFloesStrain(x, t, Floes, wave):
                 # Add event to fracture history
                 getFractureHistory().addChildren(Floes[iF], createdFloes, t)
 
-                # Set properties induced by wave and insert floes in list
+                # Set properties induced by wave
                 distanceFromLeft = 0
                 nFloes = len(iFracs) + 1
+                if Spec:
+                    createdWvfs = wave.calc_wavesSets([floe.xF for floe in createdFloes])
                 for iNF in range(nFloes):
                     # Set properties and calculate waves
                     if Spec:
-                        wvf = wave.calc_waves(createdFloes[iNF].xF)
+                        wvf = createdWvfs[iNF]
                     else:
                         createdFloes[iNF].a0 = a_vec[0] if iNF == 0 else a_vec[iFracs[iNF - 1]]
                         createdFloes[iNF].phi0 = phi0 + kw * distanceFromLeft
@@ -342,15 +372,12 @@ def BreakFloesStrain(x, t, Floes, wave):
                     createdFloes[iNF].calc_w(wvf)
 
                     distanceFromLeft += createdFloes[iNF].L
-                    # Insert in list
-                    if iNF == 0:
-                        NewFloes[iF + Offset] = createdFloes[0]
-                    else:
-                        Offset += 1
-                        NewFloes.insert(iF + Offset, createdFloes[iNF])
+
+                # Floes are replaced all at once at the end of the loop
+                fractured[iF] = createdFloes
 
         if Broke:
-            Floes = NewFloes
+            Floes.replace(fractured)
 
     return Floes
 
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Container of the floes of a simulation, with their properties stored as arrays
+
+A FloeField is a sequence of Floe objects ordered from left to right (it can replace
+the list of floes of the experiments), which also keeps x0, L, h, dx, Eel and k
+in contiguous arrays (one value per floe).
+After a round of fractures, the field is rebuilt in a single pass (cf replace).
+Note: the wave attributes a0 and phi0 are not gathered, as they can be arrays (one value
+      per frequency or per time, cf WaveDef and WaveSpecDef): they stay on the floes.
+      The points of the floes are not gathered either: the broken floes are kept by the
+      fracture history, which would keep a buffer shared by all the floes alive.
+      The energies are still computed floe by floe (cf BreakFloes): the arrays are used
+      for the selection of the floes that can break (canBreak).
+"""
+
+import numpy as np
+
+
+class FloeField(object):
+    """ Floes of a simulation, from left to right
+    Note: Eel is set on the floes by the energy computations: the arrays are gathered again by update()
+    Inputs: floes: list (or FloeField) of Floe objects, ordered from left to right
+    """
+
+    # Scalar properties of the floes, gathered in arrays
+    properties = ('x0', 'L', 'h', 'dx', 'Eel', 'k')
+
+    def __init__(self, floes):
+        self.floes = list(floes)
+        self.update()
+
+    def __repr__(self):
+        return(f'FloeField object ({len(self.floes)} floes)')
+
+    def __len__(self):
+        return len(self.floes)
+
+    def __getitem__(self, index):
+        return self.floes[index]
+
+    def __iter__(self):
+        return iter(self.floes)
+
+    def update(self):
+        # Gathers the properties of the floes in arrays (nan if not set yet)
+        for name in self.properties:
+            setattr(self, name, np.array([getattr(floe, name, np.nan) for floe in self.floes],
+                                         dtype=np.float64))
+
+    def replace(self, fractured):
+        ''' Replaces the broken floes by the floes resulting from their fracture, in a single pass
+        Input: fractured (dict): {iF: list of floes resulting from the fracture of floe iF}
+        '''
+        floes = []
+        for iF, floe in enumerate(self.floes):
+            if iF in fractured:
+                floes.extend(fractured[iF])
+            else:
+                floes.append(floe)
+        self.floes = floes
+        self.update()
+
+    def canBreak(self):
+        ''' Indices of the floes whose elastic energy could pay for a fracture (Eel > k) '''
+        return np.where(self.Eel > self.k)[0]
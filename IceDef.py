@@ -7,21 +7,18 @@ Created on Tue Jan  4 14:30:37 2022
 """
 
 import os
+from itertools import islice
 import numpy as np
 import matplotlib.pyplot as plt
 import config
 
-# Allows faster computation of displacement
-from scipy.sparse.linalg import spsolve
-import scipy.sparse as sp
-
-# For multifracturing
-from itertools import combinations
 # from tqdm import tqdm
 
 from ElasticMaterials import FracToughness, Lame
 from WaveUtils import calc_k, calc_cg
-from pars import g, rho_i, rho_w, E, v, K, Deriv101
+from FlexOperator import EigenFlex, getFlexCache
+from FlexKernels import getKernels
+from pars import g, rho_i, rho_w, E, v, K
 
 
 class Floe(object):
@@ -31,6 +28,12 @@ class Floe(object):
             L:  floe length (m)
     """
 
+    # Whether sub-floe energies under a monochromatic wave are given by quadratic forms
+    # kept from one time step to the other (cf computeEnergyForms), or solved each time
+    useEnergyForms = True
+    # Maximum number of quadratic forms kept by each floe (cf EnergyForms)
+    maxEnergyForms = 2**17
+
     def __init__(self, h, x0, L, **kwargs):
 
         self.h = h
@@ -102,119 +105,54 @@ class Floe(object):
     def z_calc(self, msl):
         self.z = msl - self.hw + self.h / 2
 
-    def FlexA(self):
-        # Computes the np.array version of flex matrix
-
-        x = self.xF
-        I = self.I
-
-        dx = x[1] - x[0]
-        N = len(x)
-
-        if N == 101:
-            # For all floes at or under 100m, ie 101 points, use a precalculated matrix
-            self.A = (E * I / dx**4) * Deriv101 + (rho_w * g) * np.eye(101)
-        else:
-            # Computes the five bands of the matrix -> centered differences
-            A = 6 * np.eye(N) - 4 * np.eye(N, k=1) - 4 * np.eye(N, k=-1) \
-                + np.eye(N, k=2) + np.eye(N, k=-2)
-
-            # First two rows can't use centered difference
-            A[0, [0, 1, 2]] = np.array([2, -4, 2])
-            A[1, [0, 1, 2, 3]] = np.array([-2, 5, -4, 1])
-
-            # Last two rows can't use centered difference either
-            A[-1, [-3, -2, -1]] = np.array([2, -4, 2])
-            A[-2, [-4, -3, -2, -1]] = np.array([1, -4, 5, -2])
-
-            # Derivation factor
-            A *= E * I / (dx**4)
-
-            # Last term of homogeneous equation
-            A += (rho_w * g) * np.eye(N)
-
-            self.A = A
-
-    def FlexA_sparse(self):
-        # Computes the scipy.sparse version of the flex matrix
-
+    def FlexA_banded(self):
+        # Gets the banded (five diagonals) and LU factorized version of the flex matrix
+        # from the cache shared by all floes, where it is only computed once for each (N, dx, h, E)
         x = self.xF
-        I = self.I
         dx = x[1] - x[0]
-        N = len(x)
-
-        # Diagonal bands
-        C0 = np.ones(N)
-
-        A = sp.spdiags([C0, -4 * C0, 6 * C0, -4 * C0, C0], [-2, -1, 0, 1, 2], N, N, format='csr')
-        # First two rows can't use centered difference
-        A[0, [0, 1, 2]] = np.array([2, -4, 2])
-        A[1, [0, 1, 2, 3]] = np.array([-2, 5, -4, 1])
-
-        # Last two rows can't use centered difference either
-        A[-1, [-3, -2, -1]] = np.array([2, -4, 2])
-        A[-2, [-4, -3, -2, -1]] = np.array([1, -4, 5, -2])
-
-        A *= E * I / (dx**4)
-        A += (rho_w * g) * sp.eye(N, format='csr')
-
-        self.Asp = A
+        self.Aband = getFlexCache().get(len(x), dx, self.h)
 
     def initMatrix(self):
-        # Chooses matrix type (np.ndarray or scipy.sparse) to be more efficient
-        # -> cf Overleaf CodeEfficiency internship TLILI
+        # The flex matrix is pentadiagonal: only its bands are stored and factorized,
+        # which makes the solve O(N) whatever the size of the floe
+        # Note: the dense version of the matrix is given by self.Aband.toarray()
         N = len(self.xF)
-        if N > 250:
-            self.FlexA_sparse()
-        elif N >= 100:
-            self.FlexA()
+        if N >= 100:
+            self.FlexA_banded()
         else:
             raise ValueError('Floe should have more points')
 
     def mslf_int(self, wv):
-        x = self.xF
-        return (wv[:-1].sum() + wv[1:].sum()) * (x[1] - x[0]) / ( 2 * (x[-1] - x[0]))
+        return getKernels().mslfInt(wv, self.xF)
 
     def calc_w(self, wvf):
         b = -rho_w * g * (wvf - self.mslf_int(wvf))
-        if wvf.size > 250:
-            # Use of sparse properties to improve efficiency #points >> 1
-            self.w = spsolve(self.Asp, b)
-        else:
+        try:
+            self.w = self.Aband.solve(b)
+        except np.linalg.LinAlgError:
+            errorFile = open(os.getcwd() + '/LinAlgError.txt', 'a')
+            errorFile.write(f'h = {self.h}\n'
+                            f'x0 = {self.x0}\n'
+                            f'L = {self.L}\n'
+                            f'dx = {self.dx}\n'
+                            f'b = {b}\n')
+            errorFile.close()
+            # Solve the problem with a least squares method
             try:
-                self.w = np.linalg.solve(self.A, b)
-            except np.linalg.LinAlgError:
+                solution = np.linalg.lstsq(self.Aband.toarray(), b)
+                self.w = solution[0]
                 errorFile = open(os.getcwd() + '/LinAlgError.txt', 'a')
-                errorFile.write(f'h = {self.h}\n'
-                                f'x0 = {self.x0}\n'
-                                f'L = {self.L}\n'
-                                f'dx = {self.dx}\n'
-                                f'b = {b}\n')
+                errorFile.write(f'rank of A = {solution[2]}\n\n')
                 errorFile.close()
-                # Solve the problem with a least squares method
-                try:
-                    solution = np.linalg.lstsq(self.A, b)
-                    self.w = solution[0]
-                    errorFile = open(os.getcwd() + '/LinAlgError.txt', 'a')
-                    errorFile.write(f'rank of A = {solution[2]}\n\n')
-                    errorFile.close()
-                except np.linalg.LinAlgError:
-                    raise ValueError("Computation of w does not converge")
+            except np.linalg.LinAlgError:
+                raise ValueError("Computation of w does not converge")
 
     def calc_du(self, fname=''):
         x = self.xF
         w = self.w
-        dx = x[1] - x[0]
 
-        dw = np.zeros(len(w))
-        dw[0]  = (-3 * w[0]  + 4 * w[1]  - w[2])
-        dw[-1] = ( 3 * w[-1] - 4 * w[-2] + w[-3])
-        dw[1:-1] = (-w[:-2] + w[2:])
-        dw = dw / (2 * dx)
-
-        # Remove constant dwdx from the set, to account for rotation of the floe
-        fit = np.polyfit(x, dw, 0)
-        self.du = dw  - fit[0]
+        # Gradient with the constant dwdx removed, to account for rotation of the floe
+        self.du, slope = getKernels().du(w, x)
 
         if len(fname) > 0:
             fitw = np.polyfit(x, w, 1)
@@ -224,25 +162,18 @@ class Floe(object):
             hax[0].plot(x - x[0], x * fitw[0] + fitw[1], ':')
             hax[0].set_title(f'Deformations fit:\n {fitw[0]:0.6}x + {fitw[1]:0.6}')
 
-            hax[1].plot(x - x[0], dw)
-            hax[1].plot(x - x[0], fit * np.ones_like(x), ':')
-            hax[1].set_title(f'Deformation gradient: {fit[0]:.6f}\n')
+            hax[1].plot(x - x[0], self.du + slope)
+            hax[1].plot(x - x[0], slope * np.ones_like(x), ':')
+            hax[1].set_title(f'Deformation gradient: {slope:.6f}\n')
 
             plt.savefig(config.FigsDirFloes + '.png')
 
-        self.slope = fit[0]
+        self.slope = slope
         return self.du
 
     def calc_curv(self):
         x = self.xF
-        w = self.w
-        dx = x[1] - x[0]
-
-        d2w = np.zeros(len(w))
-        d2w[1:-1] = (w[:-2] - 2 * w[1:-1] + w[2:])
-        d2w = d2w / (dx**2)
-
-        return d2w
+        return getKernels().curv(self.w, x[1] - x[0])
 
     def calc_Eel(self, **kwargs):
         EType = 'Flex'
@@ -267,12 +198,63 @@ class Floe(object):
             intV = self.calc_curv()
             prefac = (1 / 2) * E * self.I / self.h
 
-        int2 = (intV[0]**2 / 2 + intV[-1]**2 / 2 + (intV[1:-1]**2).sum()) * self.dx
+        int2 = getKernels().trapz2(intV, self.dx)
 
         self.Eel = prefac * int2
+        self.EelBounded = False
 
         return(self.Eel)
 
+    def calc_Eel_bound(self, wvf=None, EType='Flex'):
+        ''' Upper bound of the elastic energy of the floe, without solving for its displacement
+        With M = diag(1/2, 1, ..., 1, 1/2) the trapezoid weights and G the second difference of
+        calc_curv, the flex matrix is A = M^-1 (c G^T G + rho_w * g * M) with c = E * I / dx**4.
+        Multiplying A w = b by w^T M gives c |G w|^2 <= max over s >= 0 of s |b|_M - rho_w * g * s^2,
+        i.e. the maximum over the spectrum of the operator of lambda / (c * lambda + rho_w * g)^2,
+        hence Eel_Flex <= rho_w * g / (8 * h) * integral of (wvf - mslf)^2, whatever E, dx or N
+        Inputs: wvf (np.array): waves along the floe, if not given the bound uses |wvf| <= |self.a0|
+                EType (str): 'Flex' or 'Disp', the bound is only available for 'Flex' (inf otherwise)
+        Output: bound (float): Eel <= bound
+        '''
+        if EType != 'Flex':
+            return np.inf
+
+        if wvf is None:
+            if not hasattr(self, 'a0'):
+                return np.inf
+            int2 = self.a0**2 * self.dx * (len(self.xF) - 1)
+        else:
+            int2 = getKernels().trapz2(wvf - self.mslf_int(wvf), self.dx)
+
+        return rho_w * g * int2 / (8 * self.h)
+
+    def setEelBound(self, bound):
+        # Marks the floe as not solved for, its energy being only known through an upper bound
+        # (cf calc_Eel_bound): the bound is kept in EelBound, Eel is unknown (nan) and w is removed
+        # so that it is not taken for the displacement of the floe at this time (cf plot)
+        self.EelBound = bound
+        self.Eel = np.nan
+        self.EelBounded = True
+        if hasattr(self, 'w'):
+            del self.w
+
+    def startEnergiesMemo(self):
+        ''' Starts the memo of sub-floe energies used by a fracture search (cf EnergiesMemo)
+        Output: (bool) True if a new memo was started, False if an enclosing search already owns one
+        Note: the memo only lives during the search, its owner releases it with releaseEnergiesMemo
+        '''
+        if hasattr(self, 'energiesMemo'):
+            return False
+        self.energiesMemo = EnergiesMemo(len(self.xF))
+        if hasattr(self, 'Eel'):
+            self.energiesMemo[0, -1] = self.Eel
+        return True
+
+    def releaseEnergiesMemo(self):
+        # Frees the memo of sub-floe energies, keeping how much of it was filled in energiesStats
+        self.energiesStats = self.energiesMemo.stats()
+        del self.energiesMemo
+
     def computeEnergyIfFrac(self, iFracs, wave, t, EType, verbose=False, recompute=False):
         ''' Computes the resulting energy is a fracture occurs at indices iFrac
         Inputs:
@@ -282,55 +264,58 @@ class Floe(object):
         Outputs:
             xFracs (list of float): points of fracture
             Eel (float): resulting elastic energy
-            floes (list of Floes): list of resulting floes
+            floes (list of Floes): list of resulting floes (read-only SubFloe views unless recompute)
         '''
 
-        if isinstance(iFracs, (int, np.int32, np.int64)):
-            iFracs = [iFracs]
-        else:
-            iFracs = list(iFracs)
-        assert min(iFracs) > 0 and max(iFracs) < len(self.xF) - 1
-
-        # Computes the fracture points and the resulting floes
-        xFracs = [self.xF[i] for i in iFracs]
-        floes = self.fracture(xFracs)
-
-        # Set properties induces by the wave and compute elastic energies
-        iFracs.append(len(self.xF) - 1)
-        iFracs.insert(0, 0)
-        Eel_list = []
-        Eel = 0
-        nFloes = len(floes)
-        for iF in range(nFloes):
-            EelFloe = self.energiesMatrix[iFracs[iF], iFracs[iF + 1]]
-
-            # Compute energie only if not already computed
-            # or if the floes need to be initialized again at the end of the search
-            if EelFloe < 0 or recompute:
-                if wave.type == 'WaveSpec':
-                    wvf = wave.calc_waves(floes[iF].xF)
+        # Memo of the subfloes energies, only kept during the search
+        ownMemo = self.startEnergiesMemo()
+        try:
+            if isinstance(iFracs, (int, np.int32, np.int64)):
+                iFracs = [iFracs]
+            else:
+                iFracs = list(iFracs)
+            assert min(iFracs) > 0 and max(iFracs) < len(self.xF) - 1
+
+            # Computes the fracture points and the resulting floes
+            # (hypothetical floes are only views, Floe objects are built for the chosen fractures)
+            xFracs = [self.xF[i] for i in iFracs]
+            iFracs.append(len(self.xF) - 1)
+            iFracs.insert(0, 0)
+            if recompute:
+                floes = self.fracture(xFracs)
+            else:
+                floes = [self.subFloeView(iFracs[iF], iFracs[iF + 1]) for iF in range(len(xFracs) + 1)]
+
+            # Set properties induces by the wave and compute elastic energies
+            Eel_list = []
+            Eel = 0
+            nFloes = len(floes)
+            for iF in range(nFloes):
+                EelFloe = self.energiesMemo[iFracs[iF], iFracs[iF + 1]]
+
+                # Compute energie only if not already computed
+                # or if the floes need to be initialized again at the end of the search
+                if EelFloe < 0 or recompute:
+                    wvf = self.subFloeWaves(floes[iF], iFracs[iF], wave, t)
+                    EelFloe = floes[iF].calc_Eel(EType=EType, wvf=wvf)
+                    self.energiesMemo[iFracs[iF], iFracs[iF + 1]] = EelFloe
+
+                if verbose:
+                    Eel_list.append(EelFloe)
                 else:
-                    a_vec = wave.amp_att(self.xF, self.a0, [self])
-                    floes[iF].a0 = a_vec[iFracs[iF]]
-                    floes[iF].phi0 = self.phi0 + self.kw * (floes[iF].x0 - self.x0)
-                    wvf = wave.waves(floes[iF].xF, t, amp=floes[iF].a0,
-                                     phi=floes[iF].phi0, floes=[floes[iF]])
-
-                EelFloe = floes[iF].calc_Eel(EType=EType, wvf=wvf)
-                self.energiesMatrix[iFracs[iF], iFracs[iF + 1]] = EelFloe
+                    Eel += EelFloe
 
             if verbose:
-                Eel_list.append(EelFloe)
+                return xFracs, Eel_list, floes
             else:
-                Eel += EelFloe
-
-        if verbose:
-            return xFracs, Eel_list, floes
-        else:
-            return xFracs, Eel, floes
+                return xFracs, Eel, floes
+        finally:
+            if ownMemo:
+                self.releaseEnergiesMemo()
 
     def FindE_minVerbose(self, maxFracs, wave, t, **kwargs):
         ''' Finds the minimum of energy for all fracturation possible
+        The best partition for each number of fractures is given by dynamic programming (cf multiFracDPk)
         Inputs:
             maxFracs (int): maximum number of simultaneous fractures
             wave, t (usual)
@@ -338,7 +323,9 @@ class Floe(object):
             xFracs (list of float): points inside the floe where minimal fracture occurs
             floes (list of Floe): resulting floes
             Et_min (float): minimal total energy
-            Eel_floes (list): energy of each individual floe
+            Eel_floes (list): energy of each individual floe, if V=True:
+                              [Eel, [[Eel_left, Eel_right] for each single fracture],
+                               [energies of the floes of the best partition with 2 fractures], ...]
         '''
 
         EType = 'Flex'
@@ -350,59 +337,59 @@ class Floe(object):
             elif key == 'V':
                 verbose = value
 
-        maxPosition = len(self.xF) - 1
-        admissibleIndices = np.arange(start=1, stop=maxPosition, dtype=int)
-
-        # Matrix of computed elastic energies is initialized with negative values
-        self.energiesMatrix = np.full((len(self.xF), len(self.xF)), -1, dtype=np.float64)
-
-        # Arrays to compare solutions given for different number of fractures
-        energyMins = np.empty(maxFracs)  # Total energy
-        indicesMin = np.empty(maxFracs, dtype=object)
-
-        e_lists = [self.Eel] * (maxFracs + 1)
-        for numberFrac in range(1, maxFracs + 1):
-            # List of all tuple of {numberFrac} indices where a frac will be calculated
-            indicesFrac = list(combinations(admissibleIndices, numberFrac))
-
-            # TODO: could be done a lot faster with parallelization or numpy operations
-            # Array of all computed energies
+        # Memo of the subfloes energies, only kept during the search
+        ownMemo = self.startEnergiesMemo()
+        try:
+            e_lists = [self.Eel] * (maxFracs + 1)
             if verbose:
-                e_temp = [self.computeEnergyIfFrac(iFracs, wave, t, EType, verbose=True)[1]
-                          for iFracs in indicesFrac]
-                          # for iFracs in tqdm(indicesFrac, desc=f'Fracture Loop {numberFrac}')]
-                e_lists[numberFrac] = e_temp
-                energiesTot = [sum(e_list) + numberFrac * self.k for e_list in e_lists[numberFrac]]
-            else:
-                energiesTot = [self.computeEnergyIfFrac(iFracs, wave, t, EType)[1] + numberFrac * self.k
-                               for iFracs in indicesFrac]
-
-            # Find min and add it array of minimums
-            indMin = np.argmin(energiesTot)
-            energyMins[numberFrac - 1] = energiesTot[indMin]
-            indicesMin[numberFrac - 1] = indicesFrac[indMin]
+                # Single fracture: the whole energy landscape
+                Eel_left, Eel_right, _ = self.computeFracEnergies(wave, t, EType)
+                e_lists[1] = [[El, Er] for El, Er in zip(Eel_left, Eel_right)]
 
-        # Compute global minimum to get the fracture(s) which minimizes total energy
-        globalMin = np.argmin(energyMins)
-        Et_min = energyMins[globalMin]
-        # TODO: Make it less expensive because no need to recompute energy
-        xFracs, _, floes = \
-            self.computeEnergyIfFrac(indicesMin[globalMin], wave, t, EType, recompute=True)
+            # Minimal total energy for each number of fractures
+            energeticCost, ancestors = self.multiFracDPk(maxFracs, wave, t, EType, prune=False)
+            energyMins = energeticCost[1:, -1]
+            indicesMin = [fracsPath(ancestors, numberFrac) for numberFrac in range(1, maxFracs + 1)]
 
-        return xFracs, floes, Et_min, e_lists
-
-    def computeEnergySubFloe(self, istart, iend, wave, t, EType):
-        """ Computes the elastic energy of a floe from position self.xF[istart] to position self.xF[iend]
+            if verbose:
+                for numberFrac in range(2, maxFracs + 1):
+                    edges = [0] + indicesMin[numberFrac - 1] + [len(self.xF) - 1]
+                    e_lists[numberFrac] = [self.energiesMemo[edges[iF], edges[iF + 1]]
+                                           for iF in range(numberFrac + 1)]
+
+            # Compute global minimum to get the fracture(s) which minimizes total energy
+            globalMin = np.argmin(energyMins)
+            Et_min = energyMins[globalMin]
+            xFracs, _, floes = \
+                self.computeEnergyIfFrac(indicesMin[globalMin], wave, t, EType, recompute=True)
+
+            return xFracs, floes, Et_min, e_lists
+        finally:
+            if ownMemo:
+                self.releaseEnergiesMemo()
+
+    def subFloe(self, istart, iend):
+        """ Returns the floe from position self.xF[istart] to position self.xF[iend]
         Inputs:
             istart (int): index of the left edge in the parent floe (self)
             iend (int): index of the right edge
-            wave, t, EType: usual
         Outputs:
-            None -> writes the resulting energy in the attribute energiesMatrix of self
+            floe (Floe): the sub-floe, with the wave attributes of self
         """
         floeLength = self.xF[iend] - self.xF[istart]
-        floe = Floe(self.h, self.xF[istart], floeLength,
-                    DispType=self.DispType, dx=min(self.dx, floeLength / 100))
+        return self.subFloeAt(self.xF[istart], floeLength)
+
+    def subFloeAt(self, x0, L, dx=None):
+        """ Returns the floe of length L starting at position x0 of self
+        Inputs:
+            x0, L (float): position of the left edge and length of the sub-floe
+            dx (float): resolution of the sub-floe, min(self.dx, L / 100) by default (cf fracture)
+        Outputs:
+            floe (Floe): the sub-floe, with the wave attributes of self
+        """
+        if dx is None:
+            dx = min(self.dx, L / 100)
+        floe = Floe(self.h, x0, L, DispType=self.DispType, dx=dx)
 
         # Relay the wave attributes if present
         if hasattr(self, 'kw'):
@@ -412,133 +399,607 @@ class Floe(object):
         if hasattr(self, 'alpha'):
             floe.alpha = self.alpha
 
-        # Compute waves under the floe
+        return floe
+
+    def subFloeView(self, istart, iend):
+        # Returns a read-only view of the sub-floe from self.xF[istart] to self.xF[iend],
+        # which has the geometry of subFloe(istart, iend) without building it (cf SubFloe)
+        return SubFloe(self, istart, iend)
+
+    def subFloeViewAt(self, xStart, xEnd):
+        # Returns a read-only view of the sub-floe between any two positions of self (cf SubFloe)
+        return SubFloe(self, None, None, edges=(xStart, xEnd))
+
+    def subFloeWaves(self, floe, istart, wave, t):
+        """ Computes the waves under a sub-floe of self starting at self.xF[istart]
+        The waves under self are only computed once for all its sub-floes (cf getForcing):
+        they are sliced if the sub-floe has the points of self, otherwise (finer sub-floes)
+        only the amplitude at its left edge is taken from them
+        """
+        forcing = self.getForcing(wave, t)
+        if wave.type != 'WaveSpec':
+            floe.a0 = forcing.amp[istart]
+            floe.phi0 = self.phi0 + self.kw * (self.xF[istart] - self.xF[0])
+
+        wvf = self.forcingSlice(forcing, floe, istart)
+        if wvf is not None:
+            return wvf
+        elif wave.type == 'WaveSpec':
+            return wave.calc_waves(floe.xF)
+        else:
+            return wave.waves(floe.xF, t, amp=floe.a0, phi=floe.phi0, floes=[floe])
+
+    def subFloeWavesBatch(self, floes, istarts, wave, t):
+        # Batched version of subFloeWaves: under a spectrum, the waves under all the sub-floes
+        # that are not slices of the waves under self are computed at once (cf WaveSpec.calc_wavesSets)
+        if wave.type != 'WaveSpec':
+            return [self.subFloeWaves(floe, istart, wave, t) for floe, istart in zip(floes, istarts)]
+
+        forcing = self.getForcing(wave, t)
+        wvfs = [self.forcingSlice(forcing, floe, istart) for floe, istart in zip(floes, istarts)]
+        iFiner = [iFloe for iFloe, wvf in enumerate(wvfs) if wvf is None]
+        for iFloe, wvf in zip(iFiner, wave.calc_wavesSets([floes[iFloe].xF for iFloe in iFiner])):
+            wvfs[iFloe] = wvf
+        return wvfs
+
+    def forcingSlice(self, forcing, floe, istart):
+        # Waves under a sub-floe starting at self.xF[istart] taken from the waves under self,
+        # if it has the points of self (None otherwise)
+        nPoints = len(floe.xF)
+        if istart + nPoints <= len(self.xF) and \
+                np.isclose(floe.xF[1] - floe.xF[0], self.xF[1] - self.xF[0], rtol=1e-9, atol=0):
+            return forcing.wvf[istart:istart + nPoints]
+        return None
+
+    def getForcing(self, wave, t):
+        """ Returns the waves forcing the floe at time t (cf FloeForcing)
+        They are kept from one call to the other, and only computed again when t, the waves
+        (for a spectrum, its amplitudes or phases, cf WaveSpec.fieldVersion) or the amplitude
+        and phase of a monochromatic wave at the left edge of the floe change
+        """
         if wave.type == 'WaveSpec':
-            wvf = wave.calc_waves(floe.xF)
+            state = (wave.fieldVersion,)
         else:
-            a_vec = wave.amp_att(self.xF, self.a0, [self])
-            floe.a0 = a_vec[istart]
-            floe.phi0 = self.phi0 + self.kw * (self.xF[istart] - self.xF[0])
-            wvf = wave.waves(floe.xF, t, amp=floe.a0, phi=floe.phi0, floes=[floe])
+            state = (float(self.a0), float(self.phi0), float(self.kw))
+        signature = (wave, t, len(self.xF), self.xF[0], self.xF[-1]) + state
+        if getattr(self, 'forcing', None) is None or self.forcing.signature != signature:
+            self.forcing = FloeForcing(self, wave, t, signature)
+        return self.forcing
+
+    def computeEnergySubFloe(self, istart, iend, wave, t, EType):
+        """ Computes the elastic energy of a floe from position self.xF[istart] to position self.xF[iend]
+        Inputs:
+            istart (int): index of the left edge in the parent floe (self)
+            iend (int): index of the right edge
+            wave, t, EType: usual
+        Outputs:
+            None -> writes the resulting energy in the attribute energiesMemo of self
+        """
+        floe = self.subFloeView(istart, iend)
+        wvf = self.subFloeWaves(floe, istart, wave, t)
 
         EelFloe = floe.calc_Eel(EType=EType, wvf=wvf)
-        self.energiesMatrix[istart, iend] = EelFloe
+        self.energiesMemo[istart, iend] = EelFloe
+
+    def computeEnergySubFloes(self, pairs, wave, t, EType):
+        """ Batched version of computeEnergySubFloe
+        Sub-floes sharing their number of points and spacing share their flex matrix:
+        their forcings are stacked and solved in a single multi right-hand side call
+        Under a monochromatic wave, energies are instead given by quadratic forms of the wave phase
+        only computed once for the geometry of the floe (cf computeEnergyForms)
+        Inputs:
+            pairs (list of (int, int)): (istart, iend) indices of the sub-floes
+            wave, t, EType: usual
+        Outputs:
+            None -> writes the resulting energies in the attribute energiesMemo of self
+        """
+        if len(pairs) == 0:
+            return
+        istarts, iends = np.array(pairs).T
+
+        if wave.type == 'Wave' and self.useEnergyForms:
+            forms = self.computeEnergyForms(pairs, wave, EType)
+            c, s = np.cos(self.phi0), np.sin(self.phi0)
+            Eels = self.a0**2 * (c**2 * forms[:, 0] + 2 * c * s * forms[:, 1] + s**2 * forms[:, 2])
+        else:
+            floes = [self.subFloeView(istart, iend) for istart, iend in pairs]
+            wvfs = self.subFloeWavesBatch(floes, istarts, wave, t)
+            Eels = np.empty(len(pairs))
+            for iFloes, intV, scales in self.subFloeIntegrands(floes, wvfs, EType):
+                Eels[iFloes] = scales * trapzProds(intV[:, :, 0], intV[:, :, 0])
+
+        self.energiesMemo[istarts, iends] = Eels
+
+    def subFloeIntegrands(self, floes, wvfs, EType):
+        """ Integrands of the elastic energies of sub-floes of self (cf calc_Eel)
+        Sub-floes sharing their flex matrix (the cache gives the same object for the same N and dx)
+        or, when solved in the eigenbasis of their stencil, their number of points,
+        are solved at once, with all their forcings
+        Inputs:
+            floes (list of Floe or SubFloe): sub-floes of self
+            wvfs (list of np.array): waves under each sub-floe, (n,) or (n, nw) for nw different waves
+            EType: usual
+        Outputs (generator, one item per group of sub-floes):
+            iFloes (np.array of int): positions of the sub-floes of the group in floes
+            intV (np.array, (n, nFloes, nw)): integrand for each sub-floe and wave
+            scales (np.array, nFloes): energy = scale * trapezoidal sum of intV**2 (cf trapzProds)
+        """
+        groups = {}
+        for iFloe, floe in enumerate(floes):
+            operator = getattr(floe.Aband, 'eigen', floe.Aband)
+            groups.setdefault(id(operator), (operator, []))[1].append(iFloe)
+
+        for operator, iFloes in groups.values():
+            nPoints = len(floes[iFloes[0]].xF)
+            wvfsGroup = np.stack([np.reshape(wvfs[iFloe], (nPoints, -1)) for iFloe in iFloes], axis=1)
+            nWaves = wvfsGroup.shape[2]
+            wvfsGroup = wvfsGroup.reshape(nPoints, -1)
+            xFs = np.repeat(np.array([floes[iFloe].xF for iFloe in iFloes]).T, nWaves, axis=1)
+
+            b = -rho_w * g * (wvfsGroup - mslf_ints(wvfsGroup, xFs))
+            if isinstance(operator, EigenFlex):
+                # Directly from the eigenbasis, any spacing, without computing w
+                intV, prefac = operator.integrands(b, xFs[1] - xFs[0], self.h, EType)
+            else:
+                intV, prefac = calc_intVs(operator.solve(b), xFs, self.h, EType)
+
+            dxs = np.array([floes[iFloe].dx for iFloe in iFloes])
+            yield np.array(iFloes), intV.reshape(nPoints, len(iFloes), nWaves), prefac * dxs
+
+    def subFloesWaves(self, floes, wave, t):
+        # Computes the waves under sub-floes of self starting at any position (cf subFloeWaves)
+        if wave.type == 'WaveSpec':
+            return wave.calc_wavesSets([floe.xF for floe in floes])
+
+        a_vec = wave.amp_att(np.array([floe.x0 for floe in floes]), self.a0, [self])
+        wvfs = []
+        for floe, a0 in zip(floes, a_vec):
+            floe.a0 = a0
+            floe.phi0 = self.phi0 + self.kw * (floe.x0 - self.xF[0])
+            wvfs.append(wave.waves(floe.xF, t, amp=floe.a0, phi=floe.phi0, floes=[floe]))
+        return wvfs
+
+    def computeEnergiesAt(self, xStarts, xEnds, wave, t, EType):
+        """ Computes the elastic energies of sub-floes of self between any positions (not memoized)
+        Inputs:
+            xStarts, xEnds (np.array): positions of the left and right edges of the sub-floes
+            wave, t, EType: usual
+        Outputs:
+            Eels (np.array): elastic energies of the sub-floes
+        """
+        floes = [self.subFloeViewAt(xStart, xEnd) for xStart, xEnd in zip(xStarts, xEnds)]
+        wvfs = self.subFloesWaves(floes, wave, t)
+
+        Eels = np.empty(len(floes))
+        for iFloes, intV, scales in self.subFloeIntegrands(floes, wvfs, EType):
+            Eels[iFloes] = scales * trapzProds(intV[:, :, 0], intV[:, :, 0])
+        return Eels
+
+    def refineFractures(self, candidates, wave, t, EType, tol, nRefine=10):
+        """ Refines fracture positions found on the points of the floe, coarse-to-fine
+        Each fracture of a candidate is searched in turn between the points around it (its neighbouring
+        fractures being fixed), on successively finer local grids of nRefine intervals, until their
+        spacing is below tol: the position is then within tol of the position of minimal energy
+        (if the energy has a single minimum in this interval)
+        Inputs:
+            candidates (list of list of int): fracture indices in self.xF of each candidate
+            wave, t, EType: usual
+            tol (float): tolerance on the fracture positions (m)
+            nRefine (int): number of intervals of the local grids
+        Outputs:
+            xFracs (list of float): refined fracture positions of the best candidate
+            floes (list of Floe): resulting floes
+            Etot (float): total energy
+        """
+        best = None
+        for iFracs in candidates:
+            edges = [self.xF[0]] + [self.xF[i] for i in iFracs] + [self.xF[-1]]
+            for j, i in enumerate(iFracs):
+                xLeft, xRight = edges[j], edges[j + 2]
+                lower, upper = self.xF[i - 1], self.xF[i + 1]
+                while True:
+                    xs = np.linspace(lower, upper, nRefine + 1)
+                    xs = xs[(xs > xLeft) * (xs < xRight)]
+                    Eels = self.computeEnergiesAt(np.append(np.full(xs.size, xLeft), xs),
+                                                  np.append(xs, np.full(xs.size, xRight)),
+                                                  wave, t, EType)
+                    iMin = np.argmin(Eels[:xs.size] + Eels[xs.size:])
+                    edges[j + 1] = xs[iMin]
+
+                    step = (upper - lower) / nRefine
+                    if step <= tol:
+                        break
+                    lower, upper = max(xs[iMin] - step, xLeft), min(xs[iMin] + step, xRight)
+
+            Etot = self.computeEnergiesAt(edges[:-1], edges[1:], wave, t, EType).sum() + len(iFracs) * self.k
+            if best is None or Etot < best[1]:
+                best = (edges, Etot)
+
+        # Promote the floes of the best candidate
+        edges = best[0]
+        views = [self.subFloeViewAt(xStart, xEnd) for xStart, xEnd in zip(edges[:-1], edges[1:])]
+        wvfs = self.subFloesWaves(views, wave, t)
+        floes = []
+        Etot = (len(views) - 1) * self.k
+        for view, wvf in zip(views, wvfs):
+            floes.append(view.promote())
+            Etot += floes[-1].calc_Eel(EType=EType, wvf=wvf)
+
+        return edges[1:-1], floes, Etot
+
+    def getEnergyForms(self, wave, EType):
+        """ Returns the memo of the quadratic forms of the sub-floe energies (cf EnergyForms)
+        The memo is kept from one call to the other, and only started again when the geometry of the floe,
+        its wave attributes or EType change
+        """
+        signature = (len(self.xF), self.xF[0], self.xF[-1], self.dx, self.h, self.E, EType,
+                     float(self.kw), float(getattr(self, 'alpha', np.nan)), wave.k)
+        if getattr(self, 'energyForms', None) is None or self.energyForms.signature != signature:
+            self.energyForms = EnergyForms(len(self.xF), signature, maxsize=self.maxEnergyForms)
+        return self.energyForms
+
+    def releaseEnergyForms(self):
+        # Frees the memo of the quadratic forms of the sub-floe energies, eg once the floe has fractured
+        # (the broken floe is still referenced by the fracture history)
+        self.energyForms = None
+
+    def computeEnergyForms(self, pairs, wave, EType):
+        """ Quadratic forms of the energies of sub-floes of self under a monochromatic wave
+        The waves under the floe are a0 * sin(phi0 + kw * (x - x0)) (with attenuation),
+        hence the energy of a sub-floe a0**2 * (c**2 * Q0 + 2 * c * s * Q1 + s**2 * Q2),
+        with (c, s) = (cos(phi0), sin(phi0)), where only a0 and phi0 change in time
+        Inputs:
+            pairs (list of (int, int)): (istart, iend) indices of the sub-floes
+            wave, EType: usual
+        Outputs:
+            forms (np.array, (nPairs, 3)): (Q0, Q1, Q2) for each sub-floe
+        """
+        memo = self.getEnergyForms(wave, EType)
+        istarts, iends = np.array(pairs).T
+        forms = memo[istarts, iends]
+
+        missing = np.where(np.isnan(forms[:, 0]))[0]
+        if missing.size > 0:
+            # Waves of unit amplitude, with a phase 0 or pi / 2 at the left edge of self
+            # (amp_att sets the amplitude of the floe it is given, which is restored)
+            a0 = self.a0
+            a_vec = wave.amp_att(self.xF, 1., [self])
+            self.a0 = a0
+
+            floes = []
+            modes = []
+            for istart, iend in zip(istarts[missing], iends[missing]):
+                floe = self.subFloeView(istart, iend)
+                floe.a0 = a_vec[istart]
+                phi0 = self.kw * (self.xF[istart] - self.xF[0])
+                # Note: the time is not used, amplitude and phase being given
+                modes.append(np.column_stack([wave.waves(floe.xF, 0, amp=floe.a0, phi=phi0 + phase,
+                                                         floes=[floe])
+                                              for phase in [0, np.pi / 2]]))
+                floes.append(floe)
+
+            for iFloes, intV, scales in self.subFloeIntegrands(floes, modes, EType):
+                intS = intV[:, :, 0]
+                intC = intV[:, :, 1]
+                forms[missing[iFloes]] = scales[:, None] * np.column_stack([trapzProds(intS, intS),
+                                                                            trapzProds(intS, intC),
+                                                                            trapzProds(intC, intC)])
+            memo[istarts[missing], iends[missing]] = forms[missing]
+
+        return forms
+
+    def computeFracEnergies(self, wave, t, EType='Flex', prune=False):
+        """ Computes the energy landscape of a single fracture, for all fracture positions at once
+        Inputs:
+            wave, t, EType: usual
+            prune (bool): if True, right floe energies are only computed where the fracture can
+                          still lower the energy of the floe (elsewhere they are nan and Etot is inf)
+        Outputs (np.array, one value per interior point self.xF[1:-1]):
+            Eel_left: elastic energy of the floe left of the fracture
+            Eel_right: elastic energy of the floe right of the fracture
+            Etot: total energy, Eel_left + Eel_right + fracture energy
+        """
+        # Memo of the subfloes energies, only kept during the search
+        ownMemo = self.startEnergiesMemo()
+        try:
+            rightMostIndex = len(self.xF) - 1
+            iFracValues = np.arange(1, rightMostIndex)
+
+            # Compute energies of all left floes at once
+            self.computeEnergySubFloes([(0, iFrac) for iFrac in iFracValues], wave, t, EType)
+            Eel_left = self.energiesMemo[0, iFracValues]
 
-    def FindE_min(self, wave, t, multiFrac=False, EType='Flex'):
-        """ Finds the minimizing fracture in the floe, using Dijkstra method for multifracturing
+            # Then all the necessary right floes
+            if prune:
+                optimal = Eel_left + self.k <= self.Eel
+            else:
+                optimal = np.full(iFracValues.size, True)
+            self.computeEnergySubFloes([(iFrac, rightMostIndex) for iFrac in iFracValues[optimal]],
+                                       wave, t, EType)
+            Eel_right = np.where(optimal, self.energiesMemo[iFracValues, rightMostIndex], np.nan)
+
+            Etot = np.where(optimal, Eel_left + Eel_right + self.k, np.inf)
+
+            return Eel_left, Eel_right, Etot
+        finally:
+            if ownMemo:
+                self.releaseEnergiesMemo()
+
+    def FindE_min(self, wave, t, multiFrac=False, EType='Flex', search='DP', tol=None, nCoarse=3,
+                  maxFrac=None):
+        """ Finds the minimizing fracture in the floe, using dynamic programming for multifracturing
+        Fractures are searched at the points of the floe (exhaustive search), then, if tol is given,
+        refined between these points (coarse-to-fine search, cf refineFractures). The refined fractures
+        are only kept if they do not increase the energy found at the points of the floe (sub-floes between
+        any two positions end exactly on their edges, while those between points may not, cf SubFloe)
         Inputs:
             multiFrac (bool): whether a multifrac search is wanted or not
+            search (str): 'DP' for multiFracDP, 'Dijkstra' for the original multiFracDijkstra
+            maxFrac (int): maximum number of simultaneous fractures (cf multiFracDPk), None for no limit,
+                           0 for no fracture at all
+            tol (float): tolerance on the fracture positions (m), None to keep them at the points of the floe
+            nCoarse (int): number of local minima refined for a single fracture
             wave, t, EType: usual
         Outputs:
             xFracs (list):
             floes (list of floes):
             Etot (float):
         """
-        # Initialize the matrix of subfloes energies
-        self.energiesMatrix = np.full((len(self.xF), len(self.xF)), -1, dtype=np.float64)
-        self.energiesMatrix[0, -1] = self.Eel
-
-        rightMostIndex = len(self.xF) - 1
-
-        # For one fracture only
-        if not multiFrac:
-
-            # Initialize admissible frac values and total energies vector
-            iFracValues = np.arange(1, rightMostIndex)
-            Etots = np.empty(1 + iFracValues.size)
-            Etots[0] = self.Eel
-
-            # Compute total energies resulting from fracture
-            for iFrac in iFracValues:
-                self.computeEnergySubFloe(0, iFrac, wave, t, EType)
-                Eel_left = self.energiesMatrix[0, iFrac]
-                if Eel_left + self.k > self.Eel:
-                    # Do not compute right floe energy if already not optimal
-                    Etots[iFrac] = 2 * self.Eel
+        if maxFrac is not None and maxFrac < 0:
+            raise ValueError(f'maxFrac should be None or a non-negative integer, got {maxFrac}')
+        elif maxFrac == 0:
+            return [], [], self.Eel
+
+        # Memo of the subfloes energies, only kept during the search
+        ownMemo = self.startEnergiesMemo()
+        try:
+            # For one fracture only
+            if not multiFrac:
+
+                # Total energies without fracture and resulting from a fracture at each point
+                # (do not compute right floe energy if already not optimal)
+                Etots = np.empty(len(self.xF) - 1)
+                Etots[0] = self.Eel
+                _, _, Etots[1:] = self.computeFracEnergies(wave, t, EType, prune=True)
+
+                # Find minimal energy and reconstruct floe
+                iFrac = np.argmin(Etots)
+                Etot_min = Etots[iFrac]
+                if iFrac > 0 and tol is not None:
+                    # Refine the best local minima of the energy at the points of the floe
+                    Efracs = np.concatenate([[np.inf], Etots[1:], [np.inf]])
+                    iMinima = np.where((Efracs[1:-1] <= Efracs[:-2]) * (Efracs[1:-1] <= Efracs[2:]) *
+                                       np.isfinite(Efracs[1:-1]))[0] + 1
+                    iMinima = iMinima[np.argsort(Etots[iMinima], kind='stable')[:nCoarse]]
+                    refined = self.refineFractures([[i] for i in iMinima], wave, t, EType, tol)
+                    if refined[2] <= Etot_min:
+                        return refined
+                if iFrac > 0:
+                    xFracs, _, floes = self.computeEnergyIfFrac(iFrac, wave, t, EType, recompute=True)
+                    return xFracs, floes, Etot_min
                 else:
-                    self.computeEnergySubFloe(iFrac, rightMostIndex, wave, t, EType)
-                    Eel_right = self.energiesMatrix[iFrac, rightMostIndex]
-                    Etots[iFrac] = Eel_left + Eel_right + self.k
-
-            # Find minimal energy and reconstruct floe
-            iFrac = np.argmin(Etots)
-            Etot_min = Etots[iFrac]
-            if iFrac > 0:
-                xFracs, _, floes = self.computeEnergyIfFrac(iFrac, wave, t, EType, recompute=True)
-                return xFracs, floes, Etot_min
-            else:
-                return [], [], Etot_min
+                    return [], [], Etot_min
 
-        # For multifracturing, with Dijkstra
-        else:
-            # Initialize the energetic cost of each vertex,
-            # the subgraph of points to visit and the ancestors
-            energeticCost = np.full(len(self.xF), np.infty, dtype=np.float64)
-            energeticCost[0] = - self.k  # To cancel the cost of fracturation at the first step
-            toVisit = np.full(len(self.xF), True)
-            ancestors = np.full(len(self.xF), -1)
-
-            # Subfunction to find new vertex from which to explore
-            def findNextVertex():
-                indicesToVisit = np.where(toVisit)[0]
-                return indicesToVisit[energeticCost[toVisit].argmin()]
-
-            # Awsers the question: Is it relevant to add inew in the path to iold ?
-            def updateEnergeticCost(iold, inew):
-                # Do not compute energy of next subfloe if we already know the path is sub-optimal
-                if energeticCost[inew] + self.k > self.Eel:
-                    return
-
-                if self.energiesMatrix[inew, iold] < 0:
-                    self.computeEnergySubFloe(inew, iold, wave, t, EType)
-                energyElas_NewFloe = self.energiesMatrix[inew, iold]
-
-                # Update current optimal path
-                if energeticCost[iold] > energeticCost[inew] + energyElas_NewFloe + self.k:
-                    energeticCost[iold] = energeticCost[inew] + energyElas_NewFloe + self.k
-                    ancestors[iold] = inew
-
-            # Search for best energetic costs
-            # progbar = tqdm(total=len(self.xF) * (len(self.xF) - 1) // 2,
-            #                desc='Search minimal path', leave=False)
-            while np.any(toVisit):
-                currentVertex = findNextVertex()
-                toVisit[currentVertex] = False
-                for aspiringVertex in range(currentVertex):
-                    updateEnergeticCost(currentVertex, aspiringVertex)
-            #         progbar.update(1)
-            # progbar.close()
-
-            # Retrieve best path and total energy
-            currentIndex = len(self.xF) - 1
-            iFracs = []
-            while currentIndex > 0:
-                previousIndex = ancestors[currentIndex]
-                currentIndex = previousIndex
-                if currentIndex > 0:
-                    iFracs.append(currentIndex)
-
-            iFracs.reverse()
-            Etot_min = energeticCost[-1]
-            assert Etot_min < self.Eel + 1e-6, "Wrong optimization"
-
-            # Reconstruct the floes from fracture indices
-            if len(iFracs) > 0:
-                xFracs, Et_min, floes = \
-                    self.computeEnergyIfFrac(iFracs, wave, t, EType=EType,
-                                             verbose=False, recompute=True)
-                Etot_min_PostComputed = Et_min + len(xFracs) * self.k
-                if np.abs(Etot_min - Etot_min_PostComputed) > 1e-6:
-                    raise ValueError(f"Energies are not equals...\n"
-                                     f"Etot[Dijkstra] = {Etot_min:.6f}\n"
-                                     f"Etot[postComputed] = {Etot_min_PostComputed:.6f}")
-                return xFracs, floes, Etot_min
+            # For multifracturing, with dynamic programming (or Dijkstra)
             else:
-                return [], [], Etot_min
+                if maxFrac is not None:
+                    # Best path among those with at most maxFrac fractures
+                    energeticCost, ancestors = self.multiFracDPk(maxFrac, wave, t, EType)
+                    nFracs = np.argmin(energeticCost[:, -1])
+                    iFracs = fracsPath(ancestors, nFracs)
+                    Etot_min = energeticCost[nFracs, -1]
+                else:
+                    if search == 'Dijkstra':
+                        energeticCost, ancestors = self.multiFracDijkstra(wave, t, EType)
+                    elif search == 'DP':
+                        energeticCost, ancestors = self.multiFracDP(wave, t, EType)
+                    else:
+                        raise ValueError(f'Unknown search method: {search}')
+
+                    # Retrieve best path and total energy
+                    currentIndex = len(self.xF) - 1
+                    iFracs = []
+                    while currentIndex > 0:
+                        previousIndex = ancestors[currentIndex]
+                        currentIndex = previousIndex
+                        if currentIndex > 0:
+                            iFracs.append(currentIndex)
+
+                    iFracs.reverse()
+                    Etot_min = energeticCost[-1]
+                assert Etot_min < self.Eel + 1e-6, "Wrong optimization"
+
+                # Reconstruct the floes from fracture indices
+                if len(iFracs) > 0 and tol is not None:
+                    refined = self.refineFractures([iFracs], wave, t, EType, tol)
+                    if refined[2] <= Etot_min:
+                        return refined
+                if len(iFracs) > 0:
+                    xFracs, Et_min, floes = \
+                        self.computeEnergyIfFrac(iFracs, wave, t, EType=EType,
+                                                 verbose=False, recompute=True)
+                    Etot_min_PostComputed = Et_min + len(xFracs) * self.k
+                    if np.abs(Etot_min - Etot_min_PostComputed) > 1e-6:
+                        raise ValueError(f"Energies are not equals...\n"
+                                         f"Etot[{search}] = {Etot_min:.6f}\n"
+                                         f"Etot[postComputed] = {Etot_min_PostComputed:.6f}")
+                    return xFracs, floes, Etot_min
+                else:
+                    return [], [], Etot_min
+        finally:
+            if ownMemo:
+                self.releaseEnergiesMemo()
+
+    def multiFracDijkstra(self, wave, t, EType):
+        """ Minimal energy path from the left to the right edge of the floe, with Dijkstra
+        Note: the vertices are visited in increasing order, cf multiFracDP
+        Inputs:
+            wave, t, EType: usual
+        Outputs:
+            energeticCost (np.array): minimal energy to reach each vertex
+            ancestors (np.array): previous vertex on the corresponding path
+        """
+        # Initialize the energetic cost of each vertex,
+        # the subgraph of points to visit and the ancestors
+        energeticCost = np.full(len(self.xF), np.inf, dtype=np.float64)
+        energeticCost[0] = - self.k  # To cancel the cost of fracturation at the first step
+        toVisit = np.full(len(self.xF), True)
+        ancestors = np.full(len(self.xF), -1)
+
+        # Subfunction to find new vertex from which to explore
+        def findNextVertex():
+            indicesToVisit = np.where(toVisit)[0]
+            return indicesToVisit[energeticCost[toVisit].argmin()]
+
+        # Computes at once the energies of all subfloes ending at iold that can be in an optimal path
+        def computeEnergies(iold):
+            # Do not compute energy of next subfloe if we already know the path is sub-optimal
+            inews = np.arange(iold)
+            inews = inews[(energeticCost[inews] + self.k <= self.Eel) *
+                          (self.energiesMemo[inews, iold] < 0)]
+            self.computeEnergySubFloes([(inew, iold) for inew in inews], wave, t, EType)
+
+        # Awsers the question: Is it relevant to add inew in the path to iold ?
+        def updateEnergeticCost(iold, inew):
+            # Do not compute energy of next subfloe if we already know the path is sub-optimal
+            if energeticCost[inew] + self.k > self.Eel:
+                return
+
+            if self.energiesMemo[inew, iold] < 0:
+                self.computeEnergySubFloe(inew, iold, wave, t, EType)
+            energyElas_NewFloe = self.energiesMemo[inew, iold]
+
+            # Update current optimal path
+            if energeticCost[iold] > energeticCost[inew] + energyElas_NewFloe + self.k:
+                energeticCost[iold] = energeticCost[inew] + energyElas_NewFloe + self.k
+                ancestors[iold] = inew
+
+        # Search for best energetic costs
+        # progbar = tqdm(total=len(self.xF) * (len(self.xF) - 1) // 2,
+        #                desc='Search minimal path', leave=False)
+        while np.any(toVisit):
+            currentVertex = findNextVertex()
+            toVisit[currentVertex] = False
+            computeEnergies(currentVertex)
+            for aspiringVertex in range(currentVertex):
+                updateEnergeticCost(currentVertex, aspiringVertex)
+        #         progbar.update(1)
+        # progbar.close()
+
+        return energeticCost, ancestors
+
+    def multiFracDP(self, wave, t, EType):
+        """ Minimal energy path from the left to the right edge of the floe, with dynamic programming
+        The fracture graph is a left to right DAG, whose edge (i, j) costs the energy of the sub-floe
+        from i to j plus the fracture energy: the minimal cost of each vertex is obtained from
+        the already known costs of all vertices on its left, in a single ordered pass.
+        Note: this gives the same optimal path and energy as multiFracDijkstra, whose vertices
+              to visit always have an infinite cost except for the first one (ie visited in order).
+              Only the costs of vertices which cannot be in an optimal path may differ.
+        Sub-floe energies are only computed when they can improve the best known path:
+            - cost[i] + k > Eel: no path through i can beat the unbroken floe (as in Dijkstra)
+            - cost[i] + 2 * k > Eel: same, for i -> j if j is not the right edge (another fracture is needed)
+            - cost[i] + k > cost[j]: no improvement on j since sub-floe energies are positive
+        Candidates are sorted by cost so that the last bound stops the search for j early, and
+        evaluated by batches. Ties are broken as in Dijkstra (smallest i).
+        Inputs:
+            wave, t, EType: usual
+        Outputs:
+            energeticCost (np.array): minimal energy to reach each vertex
+            ancestors (np.array): previous vertex on the corresponding path
+        """
+        nPoints = len(self.xF)
+        energeticCost = np.full(nPoints, np.inf, dtype=np.float64)
+        energeticCost[0] = - self.k  # To cancel the cost of fracturation at the first step
+        ancestors = np.full(nPoints, -1)
+
+        for j in range(1, nPoints):
+            # Vertices which can be followed by a sub-floe ending at j in an optimal path
+            if j == nPoints - 1:
+                inews = np.where(energeticCost[:j] + self.k <= self.Eel)[0]
+            else:
+                inews = np.where((energeticCost[:j] + self.k) + self.k <= self.Eel)[0]
+            inews = inews[np.argsort(energeticCost[inews], kind='stable')]
+            minCosts = energeticCost[inews] + self.k
+
+            position = 0
+            batchSize = 16
+            while position < inews.size:
+                # Stop as soon as no remaining candidate can improve the cost of j
+                nUseful = np.searchsorted(minCosts, energeticCost[j], side='right')
+                if nUseful <= position:
+                    break
+                batch = inews[position:min(nUseful, position + batchSize)]
+                position += batch.size
+                batchSize *= 2
+
+                missing = batch[self.energiesMemo[batch, j] < 0]
+                self.computeEnergySubFloes([(inew, j) for inew in missing], wave, t, EType)
+
+                # Update current optimal path (smallest index on ties, as with Dijkstra)
+                for inew in batch:
+                    cost = energeticCost[inew] + self.energiesMemo[inew, j] + self.k
+                    if cost < energeticCost[j] or (cost == energeticCost[j] and inew < ancestors[j]):
+                        energeticCost[j] = cost
+                        ancestors[j] = inew
+
+        return energeticCost, ancestors
+
+    def multiFracDPk(self, maxFracs, wave, t, EType, prune=True):
+        """ Minimal energy paths from the left to the right edge of the floe, for each number of fractures
+        Same graph as multiFracDP, with the vertices split in layers by the number of fractures
+        of the path reaching them: cost[m, j] = min over i < j of cost[m - 1, i] + E(i, j) + k.
+        All layers share the sub-floe energies, so that at most N**2 / 2 of them are computed
+        (and O(maxFracs * N**2) costs compared), instead of the O(N**maxFracs) fracture combinations
+        Inputs:
+            maxFracs (int): maximum number of fractures
+            prune (bool): if True, sub-floe energies are only computed when they can be in a path
+                          beating the unbroken floe (cf multiFracDP): the costs of each layer are
+                          then exact where they are lower than the energy of the floe, only
+            wave, t, EType: usual
+        Outputs:
+            energeticCost (np.array, (maxFracs + 1, N)): minimal energy to reach each vertex with m fractures
+            ancestors (np.array, (maxFracs + 1, N)): previous vertex on the corresponding path (cf fracsPath)
+        """
+        nPoints = len(self.xF)
+        energeticCost = np.full((maxFracs + 1, nPoints), np.inf, dtype=np.float64)
+        ancestors = np.full((maxFracs + 1, nPoints), -1)
+
+        # No fracture: floes starting at the left edge
+        iends = np.arange(1, nPoints)
+        missing = iends[self.energiesMemo[0, iends] < 0]
+        self.computeEnergySubFloes([(0, iend) for iend in missing], wave, t, EType)
+        energeticCost[0, 1:] = self.energiesMemo[0, iends]
+        ancestors[0, 1:] = 0
+
+        for j in range(2, nPoints):
+            # Vertices reached with less than maxFracs fractures,
+            # which can be followed by a sub-floe ending at j
+            previous = energeticCost[:-1, 1:j] + self.k
+            usable = np.isfinite(previous).any(axis=0)
+            if prune:
+                bound = self.Eel if j == nPoints - 1 else self.Eel - self.k
+                usable *= previous.min(axis=0) <= bound
+            inews = np.where(usable)[0] + 1
+            if inews.size == 0:
+                continue
+
+            missing = inews[self.energiesMemo[inews, j] < 0]
+            self.computeEnergySubFloes([(inew, j) for inew in missing], wave, t, EType)
+
+            # Best vertex of each layer (smallest index on ties)
+            costs = previous[:, inews - 1] + self.energiesMemo[inews, j][None, :]
+            best = np.argmin(costs, axis=1)
+            minCosts = costs[np.arange(maxFracs), best]
+            reached = np.isfinite(minCosts)
+            energeticCost[1:, j] = minCosts
+            ancestors[1:, j] = np.where(reached, inews[best], -1)
+
+        return energeticCost, ancestors
 
     def calc_strain(self):
-        dw2 = self.calc_curv()
-        self.strain = self.h * dw2 / 2
+        x = self.xF
+        self.strain = getKernels().strain(self.w, x[1] - x[0], self.h)
 
     def plot(self, x, t, wvf, *args):
         if len(args) == 2:
@@ -590,3 +1051,248 @@ class Floe(object):
             self.kw = calc_k(wave.f, self.h, DispType=self.DispType)
 
         self.alpha = self.calc_alpha()
+
+
+class SubFloe(object):
+    """ Read-only view of the part of a floe between two of its points, used as a fracture candidate
+    It has the geometry of the floe given by Floe.subFloe, and shares the wave attributes and the
+    flex matrices of its parent, without building a Floe (matrix, material properties...):
+    only the floes of the chosen fractures are promoted to Floe objects (cf promote)
+    Only its wave amplitude and phase (a0, phi0) can be set, by the waves forcing it
+    Inputs: parent:        floe the candidate is part of
+            istart, iend:  indices of its edges in parent.xF
+    Optional: edges:       (xStart, xEnd) for a view between any two positions of parent (istart and iend
+                           are None), with a resolution of at most parent.dx ending on both edges
+    """
+
+    __slots__ = ('parent', 'istart', 'iend', 'h', 'x0', 'L', 'dx', 'xF', 'Aband', 'a0', 'phi0')
+    writable = ('a0', 'phi0')
+
+    def __init__(self, parent, istart, iend, edges=None):
+        if edges is None:
+            x0 = parent.xF[istart]
+            L = parent.xF[iend] - x0
+            dx = min(parent.dx, L / 100)
+            xF = np.arange(x0, x0 + L + dx / 2, dx)
+        else:
+            x0 = edges[0]
+            L = edges[1] - x0
+            nIntervals = max(100, int(np.ceil(L / parent.dx - 1e-6)))
+            dx = L / nIntervals
+            # Note: the last point is exactly on the right edge, so that it is within the floe for the waves
+            xF = np.linspace(x0, x0 + L, nIntervals + 1)
+        if len(xF) < 100:
+            raise ValueError('Floe should have more points')
+        xF.flags.writeable = False
+
+        for name, value in [('parent', parent), ('istart', istart), ('iend', iend), ('h', parent.h),
+                            ('x0', x0), ('L', L), ('dx', dx), ('xF', xF),
+                            ('Aband', getFlexCache().get(len(xF), xF[1] - xF[0], parent.h))]:
+            object.__setattr__(self, name, value)
+
+    def __repr__(self):
+        return(f'SubFloe object ({self.h}, {self.x0:4.1f}, {self.L:4.1f})')
+
+    def __setattr__(self, name, value):
+        if name not in self.writable:
+            raise AttributeError(f'SubFloe views are read-only, {name} cannot be set')
+        object.__setattr__(self, name, value)
+
+    # Wave attributes and material properties are those of the parent
+    @property
+    def DispType(self):
+        return self.parent.DispType
+
+    @property
+    def kw(self):
+        return self.parent.kw
+
+    @property
+    def cg(self):
+        return self.parent.cg
+
+    @property
+    def alpha(self):
+        return self.parent.alpha
+
+    @property
+    def k(self):
+        return self.parent.k
+
+    calc_alpha = Floe.calc_alpha
+    mslf_int = Floe.mslf_int
+
+    def calc_Eel(self, EType='Flex', wvf=None):
+        # Elastic energy of the candidate under the waves wvf (cf Floe.calc_Eel), displacements are not kept
+        for _, intV, scales in self.parent.subFloeIntegrands([self], [wvf], EType):
+            return (scales * trapzProds(intV[:, :, 0], intV[:, :, 0]))[0]
+
+    def promote(self):
+        # Returns the Floe object of the candidate, with its wave amplitude and phase if set
+        floe = self.parent.subFloeAt(self.x0, self.L, dx=self.dx)
+        for name in self.writable:
+            if hasattr(self, name):
+                setattr(floe, name, getattr(self, name))
+        return floe
+
+
+class EnergiesMemo(object):
+    """ Memo of the elastic energies of the sub-floes of a floe, used during fracture searches
+    Replaces a dense N x N matrix of which only a (usually small) part of the upper triangle is used:
+    only the computed energies are stored, keyed on istart * N + iend.
+    Indexing follows the former matrix: memo[istart, iend], with ints or arrays of indices
+    (negative indices count from the right edge), and unknown energies read as -1
+    Inputs: nPoints: number of points of the floe
+    """
+
+    def __init__(self, nPoints):
+        self.nPoints = nPoints
+        self.energies = {}
+
+    def __repr__(self):
+        return(f'EnergiesMemo object ({len(self.energies)} energies, {self.nPoints} points)')
+
+    def __len__(self):
+        return len(self.energies)
+
+    def keys(self, istarts, iends):
+        istarts, iends = np.broadcast_arrays(np.asarray(istarts), np.asarray(iends))
+        istarts = np.where(istarts < 0, istarts + self.nPoints, istarts)
+        iends = np.where(iends < 0, iends + self.nPoints, iends)
+        return istarts * self.nPoints + iends
+
+    def __getitem__(self, index):
+        keys = self.keys(*index)
+        if keys.ndim == 0:
+            return self.energies.get(int(keys), -1.)
+        return np.array([self.energies.get(key, -1.) for key in keys.ravel().tolist()],
+                        dtype=np.float64).reshape(keys.shape)
+
+    def __setitem__(self, index, values):
+        keys = self.keys(*index)
+        values = np.broadcast_to(np.asarray(values, dtype=np.float64), keys.shape)
+        self.energies.update(zip(keys.ravel().tolist(), values.ravel().tolist()))
+
+    def stats(self):
+        # Returns how much of the table of sub-floes (upper triangle) was filled
+        size = self.nPoints * (self.nPoints - 1) // 2
+        return {'filled': len(self.energies),
+                'size': size,
+                'fillRate': len(self.energies) / size if size > 0 else 0.}
+
+
+class EnergyForms(EnergiesMemo):
+    """ Memo of the quadratic forms of the energies of the sub-floes of a floe under a monochromatic wave
+    (cf Floe.computeEnergyForms), stored as (Q0, Q1, Q2) for each sub-floe.
+    Unknown forms read as nan. When more than maxsize forms are stored, the oldest ones are dropped
+    Inputs: nPoints: number of points of the floe
+            signature: geometry and wave parameters the forms are computed for (cf Floe.getEnergyForms)
+    Optional:   maxsize: maximum number of forms kept (no limit if None)
+    """
+
+    def __init__(self, nPoints, signature, maxsize=None):
+        super().__init__(nPoints)
+        self.signature = signature
+        self.maxsize = maxsize
+
+    def __repr__(self):
+        return(f'EnergyForms object ({len(self.energies)} forms, {self.nPoints} points)')
+
+    def __getitem__(self, index):
+        keys = self.keys(*index).ravel()
+        return np.array([self.energies.get(key, (np.nan, np.nan, np.nan)) for key in keys.tolist()],
+                        dtype=np.float64).reshape(-1, 3)
+
+    def __setitem__(self, index, forms):
+        keys = self.keys(*index).ravel()
+        forms = np.reshape(np.asarray(forms, dtype=np.float64), (-1, 3))
+        self.energies.update(zip(keys.tolist(), map(tuple, forms.tolist())))
+
+        # Drop the oldest forms (first inserted) beyond maxsize
+        if self.maxsize is not None and len(self.energies) > self.maxsize:
+            for key in list(islice(self.energies, len(self.energies) - self.maxsize)):
+                del self.energies[key]
+
+
+class FloeForcing(object):
+    """ Waves forcing a floe at a given time, shared by all its sub-floes (cf Floe.subFloeWaves)
+    Inputs: floe, wave, t: usual
+            signature: state of the floe and the waves they are computed for (cf Floe.getForcing)
+    Attributes: wvf (np.array): waves at the points of the floe (read-only)
+                amp (np.array): attenuated amplitude at the points of the floe (monochromatic wave only)
+    """
+
+    def __init__(self, floe, wave, t, signature):
+        self.signature = signature
+
+        if wave.type == 'WaveSpec':
+            self.wvf = wave.calc_waves(floe.xF)
+        else:
+            self.amp = wave.amp_att(floe.xF, floe.a0, [floe])
+            self.wvf = self.amp * np.sin(wave.calc_phase(floe.xF, t, phi=floe.phi0, floes=[floe]))
+        self.wvf.flags.writeable = False
+
+    def __repr__(self):
+        return(f'FloeForcing object ({len(self.wvf)} points, t: {self.signature[1]})')
+
+
+def fracsPath(ancestors, nFracs):
+    ''' Fracture indices of the minimal path reaching the right edge with nFracs fractures
+    (cf Floe.multiFracDPk)
+    Inputs: ancestors (np.array, (maxFracs + 1, N)): ancestors of the vertices of each layer
+            nFracs (int): number of fractures of the path
+    Output: iFracs (list of int): indices of the fractures, from left to right
+    '''
+    iFracs = []
+    index = ancestors.shape[1] - 1
+    for layer in range(nFracs, 0, -1):
+        index = ancestors[layer, index]
+        iFracs.append(int(index))
+    iFracs.reverse()
+    return iFracs
+
+
+def trapzProds(u, v):
+    # Trapezoidal sums (of unit step) of u * v along the points of the floes (first axis)
+    return (u[0] * v[0] + u[-1] * v[-1]) / 2 + (u[1:-1] * v[1:-1]).sum(axis=0)
+
+
+def mslf_ints(wvs, xs):
+    # Floe.mslf_int for the waves wvs under several floes of the same number of points
+    # (one floe per column, xs the corresponding points)
+    return (wvs[:-1].sum(axis=0) + wvs[1:].sum(axis=0)) * (xs[1] - xs[0]) / (2 * (xs[-1] - xs[0]))
+
+
+def calc_intVs(ws, xs, h, EType='Flex'):
+    # Integrands of Floe.calc_Eel for the displacements ws of several floes of thickness h,
+    # of the same number of points (one floe per column, xs the corresponding points)
+    # -> returns the integrands and the prefactor of their squared integral
+    dx = xs[1] - xs[0]
+
+    if EType == 'Disp':
+        dw = np.zeros_like(ws)
+        dw[0]  = (-3 * ws[0]  + 4 * ws[1]  - ws[2])
+        dw[-1] = ( 3 * ws[-1] - 4 * ws[-2] + ws[-3])
+        dw[1:-1] = (-ws[:-2] + ws[2:])
+        dw = dw / (2 * dx)
+        # Remove mean dwdx, to account for rotation of the floe (cf Floe.calc_du)
+        intV = dw - dw.mean(axis=0)
+        (l, u) = Lame(E, v)
+        prefac = u
+    elif EType == 'Flex':
+        intV = np.zeros_like(ws)
+        intV[1:-1] = (ws[:-2] - 2 * ws[1:-1] + ws[2:])
+        intV = intV / (dx**2)
+        prefac = (1 / 2) * E * (h**3 / (12 * (1 - v**2))) / h
+
+    return intV, prefac
+
+
+def calc_Eels(ws, xs, dxs, h, EType='Flex'):
+    # Floe.calc_Eel for the displacements ws of several floes of thickness h, of the same number of points
+    # (one floe per column, xs the corresponding points and dxs their resolutions)
+    intV, prefac = calc_intVs(ws, xs, h, EType)
+
+    int2 = (intV[0]**2 / 2 + intV[-1]**2 / 2 + (intV[1:-1]**2).sum(axis=0)) * dxs
+
+    return prefac * int2
@@ -18,6 +18,7 @@ from FlexUtils_obj import BreakFloes, BreakFloesStrain
 from FSDUtils import PlotFSD
 from WaveUtils import calc_k
 from WaveSpecDef import WaveSpec
+from EnvelopeStore import EnvelopeStore
 from WaveChecks import plotDisp, plot_cg
 from IceDef import Floe
 from treeForFrac import getFractureHistory, InitHistory
@@ -32,6 +33,11 @@ except:
     multiFrac = ( pars.maxFrac > 1 )
     print(f'Set multiFrac to {multiFrac} since maxFrac = {pars.maxFrac}')
 
+# Maximum number of simultaneous fractures of a floe (no limit if not set)
+maxFrac = getattr(pars, 'maxFrac', None)
+# Tolerance (m) on the fracture positions (at the points of the floes if not set)
+FracTol = getattr(pars, 'FracTol', None)
+
 FractureCriterion = pars.FractureCriterion
 
 # Ice parameters
@@ -52,6 +58,13 @@ Spec = WaveSpec(u=u, spec=pars.SpecType, n=pars.n)
 
 # calculate wave properties in ice
 Spec.checkSpec(floe1)
+# Removes the frequencies with a negligible contribution
+if getattr(pars, 'SpecTruncation', None) is not None:
+    # Fractures depend on the curvature of the waves: only bins negligible in energy and in strain are removed
+    report = Spec.truncate(pars.SpecTruncation, weight='both', floes=[floe1])
+    print(f"Kept {report['nf']} frequencies, removing {100 * report['energy']:.1f}% of the energy "
+          f"and {100 * report['strain']:.1f}% of the strain weight "
+          f"(elevation error below {report['elevation']:.2E}m)")
 ki = floe1.kw
 floe1.setWPars(Spec)
 
@@ -97,6 +110,11 @@ except AttributeError:
     repeats = 20
     phi = 2 * np.pi * np.linspace(0, 1, num=repeats, endpoint=False)
 
+# The wave energy only depends on the phases through the fractures: it can be shared by the repeats
+SpecEnvelopes = getattr(pars, 'SpecEnvelopes', None)
+if SpecEnvelopes is not None:
+    Spec.useEnvelopes(EnvelopeStore(), invariant=(SpecEnvelopes == 'invariant'))
+
 FL = [0] * repeats
 print(f'Launching {repeats} experiments:')
 for iL in range(repeats):
@@ -111,10 +129,11 @@ for iL in range(repeats):
         continue
 
     # Change the phases of each wave
-    if len(Spec.f) == 1:
+    # (phases given for all the frequencies are taken for those kept by the truncation, cf keptBins)
+    if phi.ndim == 2:
+        Spec.phi = Spec.keptBins(phi[:, iL])
+    elif len(Spec.f) == 1:
         Spec.phi = np.array([phi[iL]])
-    elif phi.ndim == 2:
-        Spec.phi = phi[:, iL]
     Spec.setWaves()
 
     # Reset the initial floe, history and domain
@@ -137,7 +156,7 @@ for iL in range(repeats):
         # Spec.plotWMean(x, floes=Floes)
         try:
             if FractureCriterion == 'Energy':
-                Floes = BreakFloes(x, t[it], Floes, Spec, multiFrac, EType)
+                Floes = BreakFloes(x, t[it], Floes, Spec, multiFrac, EType, maxFrac=maxFrac, tol=FracTol)
             elif FractureCriterion == 'Strain':
                 Floes = BreakFloesStrain(x, t[it], Floes, Spec)
             else:
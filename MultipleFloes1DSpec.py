@@ -17,6 +17,7 @@ from FlexUtils_obj import BreakFloes, BreakFloesStrain
 from FSDUtils import PlotFSD
 from WaveUtils import calc_k
 from WaveSpecDef import WaveSpec
+from EnvelopeStore import EnvelopeStore
 from WaveChecks import plotDisp, plot_cg
 from IceDef import Floe
 from treeForFrac import getFractureHistory, InitHistory
@@ -45,6 +46,13 @@ Spec = WaveSpec(u=u)
 
 # calculate wave properties in ice
 Spec.checkSpec(floe1)
+# Removes the frequencies with a negligible contribution
+if getattr(pars, 'SpecTruncation', None) is not None:
+    # Fractures depend on the curvature of the waves: only bins negligible in energy and in strain are removed
+    report = Spec.truncate(pars.SpecTruncation, weight='both', floes=[floe1])
+    print(f"Kept {report['nf']} frequencies, removing {100 * report['energy']:.1f}% of the energy "
+          f"and {100 * report['strain']:.1f}% of the strain weight "
+          f"(elevation error below {report['elevation']:.2E}m)")
 ki = floe1.kw
 floe1.setWPars(Spec)
 
@@ -73,6 +81,11 @@ if DoPlots > 0:
         # Spec.set_phases(x, t, Floes)
         # Spec.plotWMean(x, floes=[floe1], fname='Spec/Waves_{t:04.0f}.png')
 
+# The wave energy only depends on the phases through the fractures: it can be shared by the repeats
+SpecEnvelopes = getattr(pars, 'SpecEnvelopes', None)
+if SpecEnvelopes is not None:
+    Spec.useEnvelopes(EnvelopeStore(), invariant=(SpecEnvelopes == 'invariant'))
+
 FL = [0] * repeats
 
 dt = dx / (Spec.fp * Spec.wlp)
@@ -117,7 +130,7 @@ for iL in range(repeats):
         Spec.set_phases(x, t[it], Floes)
         # Spec.plotWMean(x, floes=Floes)
         if FractureCriterion == 'Energy':
-            Floes = BreakFloes(x, t[it], Floes, Spec, multiFrac, EType)
+            Floes = BreakFloes(x, t[it], Floes, Spec, multiFrac, EType, tol=getattr(pars, 'FracTol', None))
         elif FractureCriterion == 'Strain':
             Floes = BreakFloesStrain(x, t[it], Floes, Spec)
         else:
@@ -7,7 +7,7 @@ Created on Tue Jan  4 13:23:01 2022
 """
 import numpy as np
 import matplotlib.pyplot as plt
-from pars import rho_w, g
+from pars import g
 from WaveUtils import calc_k
 
 
@@ -64,13 +64,23 @@ class Wave(object):
         return(string)
 
     def amp(self, t):
+        # Amplitude of the waves at time t (float or 1-D array of times)
         if self.beta == 0:
-            output = self.n0
+            output = self.n0 if np.isscalar(t) else np.full(np.shape(t), self.n0, dtype=float)
         else:
             output = self.n0 * (1 - np.e**(-self.beta * t))
         return(output)
 
     def calc_phase(self, x, t, **kwargs):
+        ''' Phase of the waves over the domain x, whose dispersion changes under the floes
+        The phase of a point is given by the last floe starting before it (floes being ordered
+        from left to right): along the floe with the wave number of the ice, then in open water.
+        Floe edges are placed on the grid by searchsorted, so that the cost is O(nx + nFloes).
+        Unless phi is given, the phase phi0 at the left edge of each floe is interpolated from
+        the two last points before it and set on the floe.
+        t can be a 1-D array of nt times: the phase is then of shape (nt, nx), and the floes are
+        given phi0 at the last time (as after a loop over the times)
+        '''
         floes = []
         phi0 = self.phi
         calc_phi0 = True
@@ -89,40 +99,77 @@ class Wave(object):
                 iF = value
                 Spec = True
 
-        # array of phase over the domain
-        phase = self.k * x - self.omega * t + phi0
+        # array of phase over the domain (times along the first axis)
+        t = np.asarray(t, dtype=float)
+        phase = self.k * x - self.omega * (t[:, None] if t.ndim > 0 else t) + phi0
+        nF = len(floes)
+        if nF == 0:
+            return phase
 
-        # computes the phase along the floes from left to right
-        for floe in floes:
+        # Wave numbers in ice (floes sharing their thickness share it if not set)
+        kCache = {}
+        ks = np.empty(nF)
+        for jF, floe in enumerate(floes):
             if hasattr(floe, 'kw'):
-                if Spec:
-                    k = floe.kw[iF]
-                else:
-                    k = floe.kw
+                ks[jF] = floe.kw[iF] if Spec else floe.kw
+            else:
+                key = (floe.h, floe.DispType)
+                if key not in kCache:
+                    kCache[key] = calc_k(self.omega / (2 * np.pi), floe.h, DispType=floe.DispType)
+                ks[jF] = kCache[key]
+        x0s = np.array([floe.x0 for floe in floes], dtype=float)
+        Ls = np.array([floe.L for floe in floes], dtype=float)
+
+        # Phase at the left edge of each floe, index 0 being the open water before the first floe
+        phi0s = np.empty(t.shape + (nF + 1,))
+        phi0s[..., 0] = phi0 - self.omega * t
+
+        def offsets(xs, owners):
+            # Phase of points xs relative to the phase at the left edge of their floe (owners - 1)
+            m = np.maximum(owners - 1, 0)
+            return np.where(owners == 0, self.k * xs,
+                            np.where(xs <= x0s[m] + Ls[m], ks[m] * (xs - x0s[m]),
+                                     ks[m] * Ls[m] + self.k * (xs - x0s[m] - Ls[m])))
+
+        if calc_phi0:
+            # Two last points before each floe, and the previous floes setting their phase
+            ib = np.searchsorted(x, x0s, side='right') - 1
+            ia = ib - 1
+            if ia.min() < 0:
+                raise ValueError('Floes should start after the first two points of x')
+            oa = np.minimum(np.searchsorted(x0s, x[ia], side='right'), np.arange(nF))
+            ob = np.minimum(np.searchsorted(x0s, x[ib], side='right'), np.arange(nF))
+            ga = offsets(x[ia], oa)
+            gb = offsets(x[ib], ob)
+            lam = (x0s - x[ia]) / (x[ib] - x[ia])
+
+            if np.all(oa == np.arange(nF)) and np.all(ob == oa):
+                # Usual case: both points are set by the previous floe -> cumulated phase shifts
+                phi0s[..., 1:] = phi0s[..., :1] + np.cumsum(ga + lam * (gb - ga))
             else:
-                k = calc_k(self.omega / (2 * np.pi), floe.h, DispType=floe.DispType)
-
-            # Phase under the floe
-            if calc_phi0:
-                # gets two last phase values before entering the floe
-                ind = np.where(x <= floe.x0)[0][-2:]
-                phip = phase[ind]
-                xp = x[ind]
-                # computes the phase at point x0, where the floe starts
-                phi0 = phip[0] + (floe.x0 - xp[0]) * (phip[1] - phip[0]) / (xp[1] - xp[0])
-                floe.phi0 = phi0
-
-            ind = (x >= floe.x0) * (x <= floe.x0 + floe.L)
-            phase[ind] = phi0 + k * (x[ind] - floe.x0)
-            # Remaining domain (assume water, other floes will be looped over)
-            ind = x > floe.x0 + floe.L
-            phase[ind] = phi0 + k * floe.L + self.k * (x[ind] - floe.x0 - floe.L)
+                # Floes shorter than the grid spacing: one floe at a time
+                for jF in range(nF):
+                    pa = phi0s[..., oa[jF]] + ga[jF]
+                    pb = phi0s[..., ob[jF]] + gb[jF]
+                    phi0s[..., jF + 1] = pa + lam[jF] * (pb - pa)
+            for jF, floe in enumerate(floes):
+                floe.phi0 = phi0s[..., jF + 1][()] if t.ndim == 0 else phi0s[-1, jF + 1]
+        else:
+            phi0s[..., 1:] = phi0
+
+        # Phase along the floes and in the open water that follows them
+        starts = np.searchsorted(x, x0s, side='left')
+        owners = np.repeat(np.arange(nF + 1), np.diff(np.concatenate([[0], starts, [len(x)]])))
+        iIce = starts[0]
+        phase[..., iIce:] = phi0s[..., owners[iIce:]] + offsets(x[iIce:], owners[iIce:])
 
         return phase
 
     def waves(self, x, t, **kwargs):
         '''Computes the wave field over the domain,
-           taking into account the different dispersion for water and ice'''
+           taking into account the different dispersion for water and ice
+           t can be a 1-D array of nt times, the field is then of shape (nt, nx)
+           (cf wavesByChunks to bound the memory used for many times)'''
         amp = []
         phase = []
         floes = []
@@ -144,8 +191,23 @@ class Wave(object):
             amp = self.amp_att(x, self.amp(t), floes)
         elif amp == []:
             amp = self.amp(t)
+            if np.ndim(amp) > 0:
+                amp = np.reshape(amp, (-1, 1))
         return amp * np.sin(phase)
 
+    def wavesByChunks(self, x, t, chunkSize=100, **kwargs):
+        ''' Wave fields over the domain for many times, computed by chunks of at most chunkSize times
+        so that the memory used stays bounded (same arguments as waves)
+        Outputs (generator, one item per chunk):
+            tChunk (np.array): times of the chunk
+            wvf (np.array, (len(tChunk), nx)): wave field at these times
+        Note: floes are given their amplitude and phase (a0, phi0) at the last time of the chunk
+        '''
+        t = np.asarray(t, dtype=float)
+        for start in range(0, len(t), chunkSize):
+            tChunk = t[start:start + chunkSize]
+            yield tChunk, self.waves(x, tChunk, **kwargs)
+
     def mslf(self, x0, L, t):
         A = self.amp(t) / (self.k * L)
         P1 = np.cos(self.k * x0 - self.omega * t + self.phi)
@@ -163,29 +225,46 @@ class Wave(object):
         return(fig, hax)
 
     def amp_att(self, x, a0, floes):
+        ''' Amplitude of the waves over the domain x, attenuated under the floes
+        The amplitude at the left edge of each floe is a0 attenuated by all the floes on its left,
+        ie a prefix sum of alpha * L, and is set on the floe (floe.a0, for the last a0 if several are given,
+        ie at the last time for waves at several times). As for the phase (cf calc_phase),
+        the amplitude of a point is given by the last floe starting before it, in a single pass.
+        Inputs: x (np.array): points of the domain
+                a0 (float or np.array of nb floats): amplitude(s) before the first floe
+                floes (list of Floe): floes, ordered from left to right
+        Output: ax (np.array, (nx,) or (nb, nx)): amplitude at each point, for each a0
+        '''
         # Note:  for a single wave, E = (1/8) * rho_w * g * H^2 (laing1998guide)
         # Note2: attenuation is calculated using Sutherland et al, 2019
         #        with free parameter \epsilon \Delta_0 = 0.5 from BicWin Data
-
-        def a_att(x, floe, a0, k):
-            E0 = (1 / 8) * rho_w * g * (2 * a0)**2
-            Ex = E0 * np.exp(-floe.calc_alpha(k) * x)
-            ax = np.sqrt(8 * Ex / (rho_w * g)) / 2
-            return ax
-
-        # Initialize wave amplitude. No attenuation in open waters
-        # Note: no attenuation at the first point of a floe
-        ax = np.zeros_like(x, dtype=float)
-        ax[x <= floes[0].x0] = a0
+        #        -> E(x) = E0 * exp(-alpha * x), ie a(x) = a0 * exp(-alpha * x / 2)
+        a0 = np.asarray(a0, dtype=float)
+        if a0.ndim > 0:
+            a0 = a0[:, None]
 
         nF = len(floes)
+        x0s = np.array([floe.x0 for floe in floes], dtype=float)
+        Ls = np.array([floe.L for floe in floes], dtype=float)
+        xEnds = np.array([floe.xF[-1] for floe in floes], dtype=float)
+        alphas = np.array([floe.calc_alpha(self.k) for floe in floes], dtype=float)
+
+        # Relative amplitude at the left edge of each floe, and after the last one
+        # Note: no attenuation in open waters, nor at the first point of a floe
+        edgeAmps = np.exp(-np.concatenate([[0], np.cumsum(alphas * Ls)]) / 2)
         for iF in range(nF):
-            floes[iF].a0 = a0
-            pFloe = (x >= floes[iF].x0) * (x <= floes[iF].x0 + floes[iF].L)
-            xvec = np.append([floes[iF].x0], np.append(x[pFloe], floes[iF].x0 + floes[iF].L))
-            avec = a_att(xvec - floes[iF].x0, floes[iF], a0, self.k)
-            ax[pFloe] = avec[1:-1]
-            ax[x > floes[iF].xF[-1]] = avec[-1]
-            a0 = avec[-1]
-
-        return(ax)
+            floes[iF].a0 = a0[-1, 0] * edgeAmps[iF] if a0.ndim > 0 else a0 * edgeAmps[iF]
+
+        # Relative amplitude of each point, from the last floe starting before it (0: before the first floe)
+        # Note: points past the last point of a floe are given its amplitude at x0 + L, while its
+        #       points past x0 + L (xF[-1] may exceed it) keep the amplitude before it (none for the first floe)
+        owners = np.searchsorted(x0s, x, side='right')
+        iF = np.maximum(owners - 1, 0)
+        inFloe = (owners > 0) * (x <= x0s[iF] + Ls[iF])
+        pastEnd = (owners > 0) * (x > xEnds[iF])
+        ax = np.where(owners == 0, 1.,
+                      np.where(pastEnd, edgeAmps[owners],
+                               np.where(inFloe, edgeAmps[iF] * np.exp(-alphas[iF] * (x - x0s[iF]) / 2),
+                                        np.where(iF > 0, edgeAmps[iF], 0.))))
+
+        return(a0 * ax)
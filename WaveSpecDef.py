@@ -6,13 +6,151 @@ Created on Fri Jan 21 12:01:18 2022
 @author: auclaije
 """
 
+from collections import OrderedDict
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy import interpolate
 from WaveUtils import PM, Jonswap, PowerLaw, SpecVars, calc_k
 from WaveDef import Wave
+import pars
 from pars import g, SpecType, tail_fac
 
+# Options that pars files written before them (eg by GenExp) do not have take their default value
+SpecInterp = getattr(pars, 'SpecInterp', 'quadratic')
+SpecPhasors = getattr(pars, 'SpecPhasors', False)
+
+
+class GridLookup(object):
+    """ Linear interpolation of values given on a grid, for all frequencies at once
+    Nothing is built: the points are located in the grid when evaluating (cf index),
+    which can be shared by lookups on the same grid
+    Inputs: x (np.array): increasing grid
+            values (np.array, (nf, len(x))): values at the grid points, for each frequency
+    """
+
+    def __init__(self, x, values):
+        self.x = x
+        self.values = values
+
+    def __repr__(self):
+        return(f'{type(self).__name__} object ({self.values.shape[0]} frequencies, {len(self.x)} points)')
+
+    def __len__(self):
+        return self.values.shape[0]
+
+    def __getitem__(self, iF):
+        # Interpolant of frequency iF alone
+        lookup = type(self)(self.x, self.values[[iF]])
+        return lambda x: lookup(x)[0]
+
+    def sameGrid(self, other):
+        return other.x is self.x or np.array_equal(other.x, self.x)
+
+    def checkRange(self, x):
+        # Same error as interp1d for points outside of the grid
+        if x.size > 0 and (x.min() < self.x[0] or x.max() > self.x[-1]):
+            raise ValueError('A value in x_new is outside of the interpolation range.')
+
+    def index(self, x):
+        ''' Locates the points x in the grid
+        Input: x (np.array): points, in the range of the grid
+        Outputs: i (np.array of int): index of the grid interval of each point
+                 dx (np.array): distance of each point to the left end of its interval
+        '''
+        x = np.asarray(x)
+        self.checkRange(x)
+        i = np.clip(np.searchsorted(self.x, x, side='right') - 1, 0, len(self.x) - 2)
+        return i, x - self.x[i]
+
+    def __call__(self, x, index=None):
+        ''' Values at the points x for all frequencies, (nf,) + x.shape
+        Optional: index: location of x in the grid, if already known (cf index)
+        '''
+        i, dx = self.index(x) if index is None else index
+        slopes = (self.values[:, i + 1] - self.values[:, i]) / (self.x[i + 1] - self.x[i])
+        return slopes * dx + self.values[:, i]
+
+    def sines(self, x, index=None):
+        # Sines of the values at the points x (for phases)
+        return np.sin(self(x, index=index))
+
+
+class SplineLookup(GridLookup):
+    """ Quadratic spline interpolation of values given on a grid, for all frequencies at once
+    The spline of each frequency is the one of interp1d(x, values[iF], kind='quadratic'),
+    all of them being built by a single banded solve and evaluated by a single call
+    Inputs: x (np.array): increasing grid
+            values (np.array, (nf, len(x))): values at the grid points, for each frequency
+    """
+
+    def __init__(self, x, values):
+        super().__init__(x, values)
+        self.spline = interpolate.make_interp_spline(x, values.T, k=2, check_finite=False)
+
+    def __call__(self, x, index=None):
+        # Values at the points x for all frequencies, (nf,) + x.shape (index is not needed)
+        x = np.asarray(x)
+        self.checkRange(x)
+        return np.moveaxis(self.spline(x), -1, 0)
+
+
+class PhasorLookup(GridLookup):
+    """ Phases on a grid advanced in time by the rotation of their phasors
+    For a given layout of the floes, the phase of each frequency only changes in time by
+    -omega * (t - t0), t0 being the time the phases were computed at: the phasors exp(i * phase)
+    of the points asked for are kept at t0 (cf basis), and rotated by exp(-i * omega * (t - t0)),
+    so that their sines at time t need no evaluation of a transcendental function on the points
+    Inputs: x, values: grid and phases at t0 (cf GridLookup)
+            omega (np.array): angular frequency of each wave
+            t0 (float): time of the phases
+            layout: state the phases were computed for (domain, floes and waves, cf WaveSpec.phaseLayout)
+    Optional:   maxbytes: maximum size of the phasors kept, the least recently used sets of points being
+                          dropped beyond it (sets larger than maxbytes are not kept)
+    """
+
+    def __init__(self, x, values, omega, t0, layout, maxbytes=2**27):
+        super().__init__(x, values)
+        self.omega = omega
+        self.t0 = t0
+        self.layout = layout
+        self.maxbytes = maxbytes
+        self.nbytes = 0
+        self.bases = OrderedDict()
+        self.advance(t0)
+
+    def advance(self, t):
+        # Sets the time of the phases
+        self.t = t
+        self.rotation = np.exp(-1j * self.omega * (t - self.t0))
+
+    def __call__(self, x, index=None):
+        # Phases at the points x at the current time, (nf,) + x.shape
+        shift = self.omega * (self.t - self.t0)
+        return super().__call__(x, index=index) - shift.reshape((-1,) + (1,) * np.ndim(x))
+
+    def basis(self, x, index=None):
+        # Phasors at t0 at the points x, (nf,) + x.shape
+        key = (np.shape(x), np.asarray(x).tobytes())
+        phasors = self.bases.get(key)
+        if phasors is not None:
+            self.bases.move_to_end(key)
+            return phasors
+
+        phasors = np.exp(1j * super().__call__(x, index=index))
+        if phasors.nbytes <= self.maxbytes:
+            self.bases[key] = phasors
+            self.nbytes += phasors.nbytes
+            while self.nbytes > self.maxbytes:
+                _, dropped = self.bases.popitem(last=False)
+                self.nbytes -= dropped.nbytes
+        return phasors
+
+    def sines(self, x, index=None):
+        # Sines of the phases at the points x at the current time: imaginary part of the rotated phasors
+        phasors = self.basis(x, index=index)
+        rotation = self.rotation.reshape((-1,) + (1,) * (phasors.ndim - 1))
+        return rotation.real * phasors.imag + rotation.imag * phasors.real
+
 
 class WaveSpec(object):
     """ Wave spectrum for floe breaking experiment
@@ -20,6 +158,10 @@ class WaveSpec(object):
             fp:         wave length (m)
     Optional:   beta:   time scaling factor for wave height (s)
                 phi:    Initial phase of the waves, nan for random (rad)
+                interp: interpolation of the amplitudes between the points of the domain,
+                        'quadratic' (splines, cf SplineLookup) or 'linear' (cf GridLookup)
+                phasors: advances the phases in time by rotation while the floes do not change
+                         (cf PhasorLookup), instead of computing them again at each set_phases
     """
 
     def __init__(self, **kwargs):
@@ -29,6 +171,8 @@ class WaveSpec(object):
         Hs, Tp, fp, kp, wlp = SpecVars(u)  # Parameters for a typical spectrum
         spec = SpecType
         tfac = tail_fac
+        interp = SpecInterp
+        phasors = SpecPhasors
 
         beta = 0
         phi = np.nan
@@ -80,6 +224,10 @@ class WaveSpec(object):
                 n = value
             elif key == 'tail_fac':
                 tfac = value
+            elif key == 'interp':
+                interp = value
+            elif key == 'phasors':
+                phasors = value
             else:
                 print(f'Unknow input: {key}')
 
@@ -92,6 +240,10 @@ class WaveSpec(object):
         self.wlp = wlp
         self.beta = beta
         self.tail_fac = tfac
+        if interp not in ('quadratic', 'linear'):
+            raise ValueError(f'Unknown interpolation type: {interp}')
+        self.interp = interp
+        self.phasors = phasors
 
         if len(f) == 1 or spec == 'Mono':
             self.f = np.array([fp])
@@ -134,6 +286,16 @@ class WaveSpec(object):
         self.setWaves()
         self.af = [0] * self.nf
 
+        # Surface elevations at the sets of points already evaluated since the last change of
+        # the amplitudes or phases (cf calc_waves), and number of these changes
+        self.fieldCache = {}
+        self.fieldCacheSize = 4096
+        self.fieldVersion = 0
+
+        # Store of the wave energies (cf useEnvelopes)
+        self.envelopes = None
+        self.invariantEnvelope = False
+
     def __repr__(self):
         Hsstr = f'{self.Hs:.2f}' if self.Hs > 0.1 else f'{self.Hs:.2E}'
         Tpstr  = f'{self.Tp:.2f}' if self.Tp  > 0.1 else f'{self.Tp:.2E}'
@@ -159,6 +321,93 @@ class WaveSpec(object):
         self.cgw = self.cgw[~ind]
         floe.setWPars(self)
 
+    def truncate(self, tol, weight='energy', merge=False, floes=[]):
+        ''' Removes the frequencies contributing the least to the waves
+        The bins are removed from the smallest contribution up, as long as the removed contributions
+        are below a fraction tol of the total: with merge, their energy is given to the nearest kept bin
+        (whose band is widened), so that the total energy and Hs are unchanged
+        Inputs: tol (float): fraction of the total contribution that can be removed
+                weight (str): contribution of a bin, 'energy' (Ei * df) or 'strain' (k**4 * Ei * df,
+                              the strain being proportional to the curvature k**2 * a of the waves),
+                              or 'both' for the bins whose energy and strain are both below tol
+                merge (bool): merges the removed bins into their neighbours instead of dropping them
+                floes (list): floes whose wave properties are updated (cf Floe.setWPars)
+        Output: report (dict): number of frequencies kept and removed, fractions of the energy and
+                               of the strain weight removed (or moved), and error bounds on the
+                               surface elevation (m) and on its curvature in open water (1/m):
+                               sums of the amplitudes (times k**2) of the removed or changed waves
+        '''
+        nf = len(self.f)
+        E = self.Ei * self.df
+        k = (2 * np.pi * self.f)**2 / g
+        contributions = {'energy': E, 'strain': k**4 * E}
+        if weight == 'both':
+            weights = list(contributions.values())
+            w = np.maximum(E / E.sum(), contributions['strain'] / contributions['strain'].sum())
+        elif weight in contributions:
+            weights = [contributions[weight]]
+            w = contributions[weight]
+        else:
+            raise ValueError(f'Unknown weight: {weight}')
+
+        # Smallest contributions first, the largest bin being always kept
+        order = np.argsort(w, kind='stable')
+        removable = np.all([np.cumsum(wi[order]) <= tol * wi.sum() for wi in weights], axis=0)
+        removed = order[removable][:nf - 1]
+        keep = np.ones(nf, dtype=bool)
+        keep[removed] = False
+
+        a = (2 * E)**0.5
+        Enew = E.copy()
+        dfNew = self.df.copy()
+        if merge and len(removed) > 0:
+            # Nearest kept bin (in frequency) of each removed bin
+            iKept = np.where(keep)[0]
+            nearest = iKept[np.argmin(abs(self.f[removed, None] - self.f[None, iKept]), axis=1)]
+            np.add.at(Enew, nearest, E[removed])
+            np.add.at(dfNew, nearest, self.df[removed])
+        elevation = a[removed].sum() + ((2 * Enew[keep])**0.5 - a[keep]).sum()
+        curvature = (k * k * a)[removed].sum() + (k[keep]**2 * ((2 * Enew[keep])**0.5 - a[keep])).sum()
+
+        report = {'nf': int(keep.sum()),
+                  'removed': len(removed),
+                  'energy': float(E[removed].sum() / E.sum()),
+                  'strain': float(contributions['strain'][removed].sum() / contributions['strain'].sum()),
+                  'elevation': float(elevation),
+                  'curvature': float(curvature)}
+
+        self.f = self.f[keep]
+        self.df = dfNew[keep]
+        self.Ei = Enew[keep] / self.df
+        self.nf = len(self.f)
+        self.k = (2 * np.pi * self.f)**2 / g
+        self.cgw = 0.5 * (g / self.k)**0.5
+        self.phi = self.phi[:nf][keep]
+        # Bins kept among those of the spectrum before any truncation (cf keptBins)
+        kept = getattr(self, 'keep', np.ones(nf, dtype=bool))
+        self.keep = kept.copy()
+        self.keep[kept] = keep
+        self.setWaves()
+        self.af = [0] * self.nf
+        if hasattr(self, 'phif'):
+            del self.phif
+        self.clearFieldCache()
+        for floe in floes:
+            floe.setWPars(self)
+
+        self.truncation = report
+        return report
+
+    def keptBins(self, values):
+        ''' Values of the frequencies kept by truncate, from values given for the frequencies of the
+        spectrum before its truncation (e.g. the phases of the repeats of an experiment, cf pars.phi0)
+        Input: values (np.array): values for the (first) frequencies of the full spectrum
+        Output: values (np.array): values for the frequencies of the spectrum, unchanged if not truncated
+        '''
+        if not hasattr(self, 'keep'):
+            return values
+        return np.asarray(values)[:len(self.keep)][self.keep]
+
     def calcE(self):
         return np.sum(self.df * self.Ei)
 
@@ -181,94 +430,178 @@ class WaveSpec(object):
 
     def calcExt(self, x, t, *args):
         # Calculate the wave energy for a given domain x and at a given time t
-        # Check if ice info was passed and set last x or the ice
+        # Check if ice info was passed
         floes = []
         if len(args) > 0:
             floes = args[0]
-            calcIce = True
-            x0 = floes[0].x0
-        else:
-            calcIce = False
-            x0 = x[-1]
         self.t = t
 
         # Make sure floes have the proper wave information
         for floe in floes:
             if not hasattr(floe, 'kw'):
                 floe.setWPars(self)
+        ice = self.iceArrays(floes, merge=self.invariantEnvelope) if len(floes) > 0 else None
+
+        # Energy replayed from the store if it was already computed for this configuration (cf useEnvelopes)
+        Ex = None
+        if self.envelopes is not None:
+            config = self.envelopeConfig(x, ice)
+            Ex = self.envelopes.get(config, t)
+        if Ex is None:
+            Ex = self.calcEnvelope(x, t, ice)
+            if self.envelopes is not None:
+                self.envelopes.put(config, t, Ex)
+
+        amp = (2 * Ex * self.df[:, None]) ** 0.5
+        # Where amplitude is 0, add an exponentially decreasing tail
+        # to smooth the transition at a characteristic scale of tail_fac
+        iax = amp > 0
+        nPos = iax.sum(axis=1)
+        tails = (nPos > 0) * (nPos < len(x))
+        if tails.any():
+            indL = len(x) - 1 - np.argmax(iax[:, ::-1], axis=1)
+            ampL = amp[np.arange(len(self.f)), indL]
+            xL = x[indL]
+            iF0, ix0 = np.nonzero(tails[:, None] * np.invert(iax))
+            amp[iF0, ix0] = ampL[iF0] * np.exp( -(1 / self.tail_fac) * self.k[iF0] * (x[ix0] - xL[iF0]))
+
+        if self.interp == 'linear':
+            self.af = GridLookup(x, amp)
+        else:
+            self.af = SplineLookup(x, amp)
 
+        self.Ex = Ex
+        self.x = x
+        self.clearFieldCache()
+
+    def calcEnvelope(self, x, t, ice=None):
+        ''' Wave energy in the domain x at time t
+        Inputs: x (np.array): domain
+                t (float): time
+                ice (dict): ice in the domain (cf iceArrays), None for open water
+        Output: Ex (np.array, (nf, len(x))): wave energy of each frequency
+        '''
+        x0 = x[-1] if ice is None else ice['x0'][0]
         xw = self.cgw * t  # Distance traveled by the energy for each frequency
         Ex = np.zeros([len(self.f), len(x)])
         Ex[:, 0] = self.Ei
 
-        for iF in range(len(self.f)):
-            # Before the ice, just propagate energy
-            Ex[iF, x <= min([xw[iF], x0])] = self.Ei[iF]
-
-            # If there is ice, for each floe, calculate where the energy makes it
-            # and propagate and attenuated spectrum
-            if calcIce:
-                t_prop = floes[0].x0 / self.cgw[iF]  # Time to propagate to the ice
-                last = True
-                if t > t_prop:
-                    for ifloe in np.arange(len(floes)):
-                        floe = floes[ifloe]
-                        k = floe.kw[iF]
-                        cg = floe.cg[iF]
-
-                        x_prop = cg * (t - t_prop)  # Distance traveled in the ice
-
-                        # Waves didn't make it through the floe
-                        if x_prop < floe.L:
-                            ind = (x >= floe.x0) * (x <= floe.x0 + x_prop)
-                            last = True
-                            if sum(ind) == 0:
-                                break
-                        # Waves did make it through
-                        else:
-                            ind = (x >= floe.x0) * (x <= floe.x0 + floe.L)
-                            t_prop += min([x_prop, floe.L]) / cg
-                            last = False
-
-                        # Attenuation and initial energy
-                        alpha = floe.alpha[iF]
-                        # First floe, only water before, no attenuation
-
-                        if ifloe == 0:
-                            E0 = Ex[iF, x <= floe.x0][-1]
-                        # Any other floe, propagate the last energy calculated
-                        # to the actual beginning of the new floe
-                        else:
-                            indL = np.where(x <= floe.x0)[0][-1]
-                            dx = floe.x0 - x[indL]
-                            alpha_p = (1 / 2) * floes[ifloe - 1].h * k**2
-                            E0 = Ex[iF, indL] * np.exp(-alpha_p * dx)
-                        Ex[iF, ind] = E0 * np.exp(-alpha * (x[ind] - floe.x0))
-                        if last:
-                            break
-
-                # If waves got through all the ice
-                if not last and t > t_prop:
-                    indL = np.where(ind)[0][-1]  # Index of the last ice point
-                    x_prop = self.cgw[iF] * (t - t_prop)  # Distance left for the energy to travel
-                    ind = (x > floe.x0 + floe.L) * (x <= floe.x0 + floe.L + x_prop)
-                    Ex[iF, ind] = Ex[iF, indL]
-
-            amp = (2 * Ex[iF, :] * self.df[iF]) ** 0.5
-            # Where amplitude is 0, add an exponentially decreasing tail
-            # to smooth the transition at a characteristic scale of tail_fac
-            iax = amp > 0
-            if iax.sum() < len(iax) and iax.sum() > 0:
-                indL = np.where(iax)[0][-1]
-                ampL = amp[indL]
-                xL = x[indL]
-                ia0 = np.invert(iax)
-                amp[ia0] = ampL * np.exp( -(1 / self.tail_fac) * self.k[iF] * (x[ia0] - xL))
-
-            self.af[iF] = interpolate.interp1d(x, amp, kind='quadratic')
-
-        self.Ex = Ex
-        self.x = x
+        # Before the ice, just propagate energy
+        before = x[None, :] <= np.minimum(xw, x0)[:, None]
+        Ex = np.where(before, self.Ei[:, None], Ex)
+
+        # If there is ice, calculate where the energy makes it in the floes
+        # and propagate an attenuated spectrum
+        if ice is not None:
+            self.propagateIce(x, t, ice, Ex)
+        return Ex
+
+    def iceArrays(self, floes, merge=False):
+        ''' Properties of the floes as arrays (one column per floe for the wave properties)
+        Inputs: floes (list): floes, ordered from left to right
+                merge (bool): merges the floes touching each other with the same wave properties
+                              (i.e. ignores the fractures within a continuous ice cover)
+        Output: ice (dict): x0, L, h (nF,) and kw, cg, alpha (nf, nF) arrays
+        '''
+        ice = {'x0': np.array([floe.x0 for floe in floes]),
+               'L': np.array([floe.L for floe in floes]),
+               'h': np.array([floe.h for floe in floes]),
+               'kw': np.array([floe.kw for floe in floes]).T,
+               'cg': np.array([floe.cg for floe in floes]).T,
+               'alpha': np.array([floe.alpha for floe in floes]).T}
+        if merge and len(floes) > 1:
+            xEnd = ice['x0'] + ice['L']
+            touching = np.isclose(ice['x0'][1:], xEnd[:-1], rtol=1e-12, atol=1e-9) * \
+                (ice['h'][1:] == ice['h'][:-1]) * (ice['kw'][:, 1:] == ice['kw'][:, :-1]).all(axis=0)
+            starts = np.concatenate([[0], np.where(np.invert(touching))[0] + 1])
+            ends = np.concatenate([starts[1:], [len(floes)]]) - 1
+            L = np.where(ends > starts, xEnd[ends] - ice['x0'][starts], ice['L'][starts])
+            ice = {key: value[..., starts] for key, value in ice.items()}
+            ice['L'] = L
+        return ice
+
+    def envelopeConfig(self, x, ice):
+        # Configuration the wave energy depends on, besides the time (cf EnvelopeStore)
+        spec = tuple(np.ascontiguousarray(value).tobytes() for value in (self.f, self.Ei, self.df, self.cgw))
+        if ice is None:
+            return spec + (x.tobytes(),)
+        keys = ('x0', 'L', 'h', 'kw', 'cg', 'alpha')
+        return spec + (x.tobytes(),) + tuple(np.ascontiguousarray(ice[key]).tobytes() for key in keys)
+
+    def useEnvelopes(self, store=None, invariant=False):
+        ''' Replays the wave energy of calcExt from a store when it was already computed for the same
+        domain, ice and time (e.g. by a previous repeat of an experiment with other phases)
+        Inputs: store (EnvelopeStore): store of the energies, None to compute them at each call
+                invariant (bool): approximation, off by default: the energy is computed with the floes
+                                  touching each other merged (cf iceArrays), i.e. as if the ice had not
+                                  fractured. It is then shared by all the repeats as long as the ice extent
+                                  is the same, but it is not the energy of the fractured floes, which the
+                                  fractures change (e.g. the points at the fractures, cf propagateIce).
+                                  The fractures are not detected: the error they make is not checked
+        Note: without invariant, the energy is replayed only for the very same floes, hence exactly,
+              but once the floes of the repeats fracture differently, their energies are not shared
+        '''
+        self.envelopes = store
+        self.invariantEnvelope = invariant
+
+    def propagateIce(self, x, t, ice, Ex):
+        ''' Propagates and attenuates the wave energy in the floes, for all frequencies at once
+        Inputs: x (np.array): domain
+                t (float): time
+                ice (dict): floes, ordered from left to right (cf iceArrays)
+                Ex (np.array, (nf, len(x))): wave energy, set in place under the floes reached by
+                                             the waves, and after the ice if they got through it
+        '''
+        x0s, Ls, hs = ice['x0'], ice['L'], ice['h']
+        kw, cg, alpha = ice['kw'], ice['cg'], ice['alpha']
+        nF = len(x0s)
+
+        # Time at which the energy reaches each floe (and gets through the last one):
+        # time to propagate to the ice, plus the time to cross the previous floes
+        tProp = np.cumsum(np.column_stack([x0s[0] / self.cgw, Ls / cg]), axis=1)
+        xProp = cg * (t - tProp[:, :-1])  # Distance traveled in each floe
+        crossed = xProp >= Ls
+        reached = np.logical_and.accumulate(np.column_stack([t > tProp[:, 0], crossed[:, :-1]]), axis=1)
+
+        # Initial energy of each floe: energy at the last point before the floe (open water for the
+        # first floe, under the floe containing the point or 0 between floes for the others),
+        # propagated to the actual beginning of the floe under the previous floe
+        iL = np.searchsorted(x, x0s, side='right') - 1
+        xL = x[iL]
+        owners = np.minimum(np.searchsorted(x0s, xL, side='right') - 1, np.arange(nF) - 1)
+        inFloe = (owners >= 0) * (xL <= x0s[owners] + Ls[owners])
+        dxO = np.where(inFloe, xL - x0s[owners], 0)
+        fac = np.where(inFloe, np.exp(-alpha[:, owners] * dxO), owners < 0)
+        alpha_p = (1 / 2) * hs[np.maximum(np.arange(nF) - 1, 0)] * kw**2
+        fac = fac * np.exp(-alpha_p * (x0s - xL))
+        fac[:, 0] = 1
+
+        if np.all(owners == np.arange(nF) - 1):
+            E0 = self.Ei[:, None] * np.cumprod(fac, axis=1)
+        else:
+            E0 = np.empty_like(fac)
+            for ifloe in range(nF):
+                Eprev = self.Ei if owners[ifloe] < 0 else E0[:, owners[ifloe]]
+                E0[:, ifloe] = Eprev * fac[:, ifloe]
+
+        # Energy under the floes, up to the distance traveled in the last floe reached.
+        # The edge shared by adjacent floes is set by the second one if the waves reached it
+        xEnd = x0s + np.where(crossed, Ls, xProp)
+        iFloe = np.searchsorted(x0s, x, side='right') - 1
+        for ifloes in (iFloe - 1, iFloe):
+            ix = np.where(ifloes >= 0)[0]
+            ifl = ifloes[ix]
+            ind = reached[:, ifl] * (x[ix] >= x0s[ifl]) * (x[ix] <= xEnd[:, ifl])
+            Ex[:, ix] = np.where(ind, E0[:, ifl] * np.exp(-alpha[:, ifl] * (x[ix] - x0s[ifl])), Ex[:, ix])
+
+        # If waves got through all the ice
+        through = reached[:, -1] * crossed[:, -1] * (t > tProp[:, -1])
+        if through.any():
+            xIce = x0s[-1] + Ls[-1]
+            indL = np.where((x >= x0s[-1]) * (x <= xIce))[0][-1]  # Index of the last ice point
+            x_prop = self.cgw * (t - tProp[:, -1])  # Distance left for the energy to travel
+            ind = through[:, None] * (x > xIce) * (x <= xIce + x_prop[:, None])
+            Ex[:] = np.where(ind, Ex[:, [indL]], Ex)
 
     def plotSpec(self, *args):
         if len(args) > 0:
@@ -327,21 +660,85 @@ class WaveSpec(object):
         return fig, hax
 
     def set_phases(self, x, t, floes=[]):
-        self.phif = [0] * self.nf
-        for iF in range(self.nf):
-            phase_i = self.waves[iF].calc_phase(x, t, floes=floes, iF=iF)
-            self.phif[iF] = interpolate.interp1d(x, phase_i)
-
-    def calc_waves(self, x):
-
-        wvfield = np.zeros_like(x, dtype='float')
-        for iF in range(self.nf):
+        # Phases are interpolated linearly between the points of x
+        # (with phasors, only advanced to t if they were computed for the same layout)
+        if self.phasors:
+            for floe in floes:
+                if not hasattr(floe, 'kw'):
+                    floe.setWPars(self)
+            layout = self.phaseLayout(x, floes)
+            if isinstance(getattr(self, 'phif', None), PhasorLookup) and self.phif.layout == layout:
+                self.phif.advance(t)
+                self.clearFieldCache()
+                return
+
+        phases = np.array([self.waves[iF].calc_phase(x, t, floes=floes, iF=iF) for iF in range(self.nf)])
+        if self.phasors:
+            omega = np.array([self.waves[iF].omega for iF in range(self.nf)])
+            self.phif = PhasorLookup(x, phases, omega, t, layout)
+        else:
+            self.phif = GridLookup(x, phases)
+        self.clearFieldCache()
+
+    def phaseLayout(self, x, floes):
+        ''' State the phases depend on, besides the time: domain, waves and floes
+        Note: the phase at the left edge of the floes (floe.phi0) is only set when the phases are computed
+        '''
+        waves = np.array([(wave.omega, wave.k, wave.phi) for wave in self.waves[:self.nf]])
+        ice = np.array([(floe.x0, floe.L) for floe in floes])
+        kw = np.array([floe.kw[:self.nf] for floe in floes])
+        return tuple(np.asarray(value, dtype=float).tobytes() for value in (x, waves, ice, kw))
+
+    def clearFieldCache(self):
+        # The surface elevation changes with the amplitudes (calcExt) and phases (set_phases)
+        self.fieldCache.clear()
+        self.fieldVersion += 1
+
+    def storeField(self, key, wvfield):
+        # Keeps a surface elevation (read-only) in the cache, dropping the oldest one if it is full
+        wvfield.flags.writeable = False
+        self.fieldCache[key] = wvfield
+        if len(self.fieldCache) > self.fieldCacheSize:
+            del self.fieldCache[next(iter(self.fieldCache))]
+        return wvfield
 
-            amp = self.af[iF](x)
-            phi = self.phif[iF](x)
+    def synthesis(self, x):
+        ''' Surface elevation at the points x, sum of the waves of all frequencies
+        Amplitudes and phases are evaluated for all frequencies at once, as (nf, len(x)) arrays,
+        and their products reduced over the frequencies in a single operation
+        '''
+        index = self.phif.index(x)
+        amp = self.af(x, index=index if self.af.sameGrid(self.phif) else None)
+        return np.einsum('i...,i...->...', amp, self.phif.sines(x, index=index))
 
-            wvfield += amp * np.sin(phi)
-        return wvfield
+    def calc_waves(self, x):
+        ''' Surface elevation at the points x (cf synthesis)
+        Within a time step, the waves are fixed: the elevation at a set of points is only computed
+        once, and read back (read-only) when the same points are asked for again
+        (e.g. a floe in each iteration of BreakFloes and in its fracture search)
+        '''
+        x = np.asarray(x, dtype='float')
+        key = (x.shape, x.tobytes())
+        if key in self.fieldCache:
+            return self.fieldCache[key]
+        return self.storeField(key, self.synthesis(x))
+
+    def calc_wavesSets(self, xs):
+        ''' Surface elevation at several sets of points (e.g. the points of several floes) at once
+        Only the sets not in the cache are computed, with a single synthesis (cf calc_waves)
+        Input: xs (list of np.array): sets of points
+        Output: (list of np.array): surface elevation at each set of points
+        '''
+        xs = [np.asarray(x, dtype='float') for x in xs]
+        keys = [(x.shape, x.tobytes()) for x in xs]
+        wvfields = {key: self.fieldCache[key] for key in keys if key in self.fieldCache}
+        missing = {key: x for key, x in zip(keys, xs) if key not in wvfields}
+        if len(missing) > 0:
+            sizes = np.cumsum([len(x) for x in missing.values()])
+            computed = np.split(self.synthesis(np.concatenate(list(missing.values()))), sizes[:-1])
+            for key, wvfield in zip(missing, computed):
+                wvfields[key] = self.storeField(key, wvfield)
+        return [wvfields[key] for key in keys]
 
     def plot(self, x, **kwargs):
         createPlot = True
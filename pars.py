@@ -27,11 +27,24 @@ f = 0.25  # frequency (Hz)
 wl = g / (2 * np.pi * f**2)
 SpecType = 'JONSWAP'
 tail_fac = 2  # wavelength factor for exponential decay past the last energetic point
+SpecInterp = 'quadratic'  # interpolation of the spectral amplitudes and phases ('quadratic' or 'linear')
+SpecPhasors = False  # advance the spectral phases in time by rotation of their phasors
+# Wave energy replayed across the repeats of spectral experiments (cf EnvelopeStore): None (computed
+# at each step), 'exact' (for the same floes, i.e. until the repeats fracture differently) or 'invariant'
+# (approximation: for the same ice extent, the energy being computed as if the ice had not fractured,
+# with no detection of the fractures nor check of the error they make, cf WaveSpec.useEnvelopes)
+SpecEnvelopes = None
+# Fraction of the energy, and of the strain weight (k**4 * energy), of the spectrum that the frequencies
+# contributing the least can be removed for in the spectral experiments (cf WaveSpec.truncate),
+# None to keep all the frequencies
+SpecTruncation = None
 n = -2  # power law exponent
 n0 = 1  # wave amplitude (m)
 
 FractureCriterion = 'Energy'
 multiFrac = True
+FracTol = None  # tolerance (m) on the fracture positions, None to keep them at the points of the floes
+FlexBackend = 'numpy'  # kernels of the floe computations ('numpy' or 'numba' if installed, cf FlexKernels)
 
 N = 101
 Deriv101 = 6 * np.eye(N) - 4 * np.eye(N, k=1) - 4 * np.eye(N, k=-1) + np.eye(N, k=2) + np.eye(N, k=-2)
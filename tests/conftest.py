@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test setup: the modules are imported from the root of the repository, and run from a
+temporary directory holding the folders that config.py expects.
+The ElasticMaterials and WaveUtils libraries of FlexFrac1D are replaced by the stand-ins of
+tests/stubs when they are not installed
+"""
+
+import os
+import sys
+import tempfile
+
+os.environ.setdefault('MPLBACKEND', 'Agg')
+testsDir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(testsDir))
+try:
+    import ElasticMaterials  # noqa: F401
+    import WaveUtils  # noqa: F401
+except ImportError:
+    sys.path.append(os.path.join(testsDir, 'stubs'))
+
+workDir = tempfile.mkdtemp(prefix='FlexFrac1D_tests_')
+for folder in ['Figs/Floes/', 'Figs/Summary/', 'Figs/Spec/', 'database/temp/']:
+    os.makedirs(os.path.join(workDir, folder), exist_ok=True)
+os.chdir(workDir)
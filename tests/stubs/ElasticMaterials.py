@@ -0,0 +1,15 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Stand-in for the ElasticMaterials library of FlexFrac1D, used by the tests when it is not installed
+"""
+
+
+def FracToughness(E, v, K):
+    # Energy release rate (J/m^2) of a material of toughness K (Pa m^1/2), in plane strain
+    return (1 - v**2) * K**2 / E
+
+
+def Lame(E, v):
+    # Lame parameters (lambda, mu) of an isotropic material
+    return E * v / ((1 + v) * (1 - 2 * v)), E / (2 * (1 + v))
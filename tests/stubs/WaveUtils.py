@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Stand-in for the WaveUtils library of FlexFrac1D, used by the tests when it is not installed
+Deep water dispersion in open water ('Open'), and elastic plate with mass loading under the ice
+"""
+
+import numpy as np
+from pars import g, rho_w, rho_i, E, v
+
+
+def omega(k):
+    # Deep water angular frequency (rad/s)
+    return np.sqrt(g * k)
+
+
+def calc_k(f, h, DispType='ML'):
+    ''' Wave number(s) at frequency(ies) f for ice of thickness h '''
+    w = 2 * np.pi * np.asarray(f, dtype=np.float64)
+    if DispType == 'Open':
+        return w**2 / g
+
+    # D / rho_w * k**5 + (g - w**2 * m) * k - w**2 = 0, with m the mass loading
+    D = E * h**3 / (12 * (1 - v**2))
+    m = rho_i * h / rho_w
+    k = np.empty(w.shape)
+    for index, wi in np.ndenumerate(w):
+        roots = np.roots([D / rho_w, 0, 0, 0, g - wi**2 * m, -wi**2])
+        k[index] = roots[(abs(roots.imag) < 1e-10) * (roots.real > 0)].real.max()
+    return k if k.ndim > 0 else float(k)
+
+
+def calc_cg(k, h, DispType='ML'):
+    ''' Group velocity (m/s) at wave number(s) k for ice of thickness h '''
+    k = np.asarray(k, dtype=np.float64)
+    if DispType == 'Open':
+        return 0.5 * np.sqrt(g / k)
+
+    D = E * h**3 / (12 * (1 - v**2))
+    m = rho_i * h / rho_w
+    num = g * k + D / rho_w * k**5
+    den = 1 + m * k
+    w = np.sqrt(num / den)
+    return ((g + 5 * D / rho_w * k**4) * den - num * m) / (2 * w * den**2)
+
+
+def SpecVars(u):
+    # Significant height, peak period, frequency, wave number and wave length of a developed sea
+    Hs = 0.0246 * u**2
+    Tp = 0.729 * u
+    fp = 1 / Tp
+    kp = (2 * np.pi * fp)**2 / g
+    wlp = 2 * np.pi / kp
+    return Hs, Tp, fp, kp, wlp
+
+
+def PM(u, f):
+    # Pierson-Moskowitz spectrum (m^2/Hz)
+    return 0.0081 * g**2 * (2 * np.pi)**-4 * f**-5 * np.exp(-0.74 * (g / (2 * np.pi * u * f))**4)
+
+
+def Jonswap(Hs, fp, f):
+    # JONSWAP spectrum (m^2/Hz), with a peak enhancement of 3.3
+    s = np.where(f <= fp, 0.07, 0.09)
+    r = np.exp(-(f - fp)**2 / (2 * s**2 * fp**2))
+    return 0.3125 * Hs**2 * fp**4 * f**-5 * np.exp(-1.25 * (fp / f)**4) * 3.3**r / 3.3**0.5
+
+
+def PowerLaw(Hs, fp, f, df, n):
+    # Spectrum (m^2/Hz) following (f / fp)**n, of significant height Hs
+    return (f / fp)**n * Hs**2 / 16 / np.sum(df * (f / fp)**n)
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fracture searches of IceDef.Floe, checked against their reference implementations
+"""
+
+from itertools import combinations
+
+import numpy as np
+import pytest
+
+from FlexUtils_obj import BreakFloes
+from IceDef import Floe, fracsPath
+from WaveDef import Wave
+from WaveUtils import calc_k
+
+
+def forcedFloe(seed, EType):
+    # Floe of random length under a random monochromatic wave,
+    # with its elastic energy at a random time
+    rng = np.random.default_rng(seed)
+    L = rng.uniform(50, 100)
+    floe = Floe(1, 10, L, DispType='Open')
+    wave = Wave(rng.uniform(0.2, 1), rng.uniform(15, 60), phi=rng.uniform(0, 2 * np.pi))
+    floe.kw = calc_k(1 / wave.T, floe.h, DispType='Open')
+    t = rng.uniform(0, 2 * wave.T)
+
+    wave.waves(np.arange(2 * floe.x0 + L), t, floes=[floe])
+    wvf = wave.waves(floe.xF, t, amp=floe.a0, phi=floe.phi0, floes=[floe])
+    floe.calc_Eel(wvf=wvf, EType=EType)
+    return floe, wave, t
+
+
+def minimalPath(floe, search, wave, t, EType):
+    # Fracture indices and total energy of the minimal path given by search (cf Floe.FindE_min)
+    floe.startEnergiesMemo()
+    try:
+        energeticCost, ancestors = search(wave, t, EType)
+    finally:
+        floe.releaseEnergiesMemo()
+
+    iFracs = []
+    index = ancestors[-1]
+    while index > 0:
+        iFracs.append(int(index))
+        index = ancestors[index]
+    iFracs.reverse()
+    return iFracs, energeticCost[-1]
+
+
+@pytest.mark.parametrize('EType', ['Flex', 'Disp'])
+@pytest.mark.parametrize('seed', range(4))
+def test_multiFracDP_matches_Dijkstra(seed, EType):
+    floe, wave, t = forcedFloe(seed, EType)
+
+    iFracsDP, energyDP = minimalPath(floe, floe.multiFracDP, wave, t, EType)
+    iFracsDijkstra, energyDijkstra = minimalPath(floe, floe.multiFracDijkstra, wave, t, EType)
+
+    assert iFracsDP == iFracsDijkstra
+    assert energyDP == pytest.approx(energyDijkstra, rel=1e-12, abs=1e-12)
+    assert energyDP <= floe.Eel + 1e-6
+
+
+@pytest.mark.parametrize('seed', range(2))
+def test_multiFracDPk_matches_combinations(seed):
+    EType = 'Flex'
+    floe, wave, t = forcedFloe(seed, EType)
+    nPoints = len(floe.xF)
+    maxFracs = 3
+
+    floe.startEnergiesMemo()
+    try:
+        energeticCost, ancestors = floe.multiFracDPk(maxFracs, wave, t, EType, prune=False)
+
+        # Energies of all sub-floes, to sum over all the fracture combinations
+        pairs = [(istart, iend) for istart in range(nPoints) for iend in range(istart + 1, nPoints)]
+        floe.computeEnergySubFloes([pair for pair in pairs if floe.energiesMemo[pair] < 0], wave, t, EType)
+        istarts, iends = np.array(pairs).T
+        energies = np.full((nPoints, nPoints), np.nan)
+        energies[istarts, iends] = floe.energiesMemo[istarts, iends]
+    finally:
+        floe.releaseEnergiesMemo()
+
+    for nFracs in range(1, maxFracs + 1):
+        iFracs = np.array(list(combinations(range(1, nPoints - 1), nFracs)))
+        edges = np.column_stack([np.zeros(len(iFracs), dtype=int), iFracs,
+                                 np.full(len(iFracs), nPoints - 1)])
+        Etots = energies[edges[:, :-1], edges[:, 1:]].sum(axis=1) + nFracs * floe.k
+        iMin = np.argmin(Etots)
+
+        assert energeticCost[nFracs, -1] == pytest.approx(Etots[iMin], rel=1e-10)
+        iFracsDPk = fracsPath(ancestors, nFracs)
+        Etot = energies[[0] + iFracsDPk, iFracsDPk + [nPoints - 1]].sum() + nFracs * floe.k
+        assert Etot == pytest.approx(Etots[iMin], rel=1e-10)
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_refined_fracture_matches_fine_grid(seed):
+    EType = 'Flex'
+    floe, wave, t = forcedFloe(seed, EType)
+    tol = 0.05
+
+    xFracsGrid, _, EtotGrid = floe.FindE_min(wave, t, EType=EType)
+    xFracs, floes, Etot = floe.FindE_min(wave, t, EType=EType, tol=tol)
+    assert len(xFracsGrid) == len(xFracs) == 1
+    assert Etot <= EtotGrid + 1e-12
+    assert sum(child.Eel for child in floes) + floe.k == pytest.approx(Etot, rel=1e-10)
+    if xFracs[0] == xFracsGrid[0]:
+        # Refinement not kept (cf FindE_min): nothing to compare with the fine grid
+        return
+
+    # Single fracture on a grid finer than tol, around the fracture at the points of the floe
+    xs = np.arange(xFracsGrid[0] - 2 * floe.dx, xFracsGrid[0] + 2 * floe.dx, tol / 10)
+    Eels = floe.computeEnergiesAt(np.append(np.full(xs.size, floe.xF[0]), xs),
+                                  np.append(xs, np.full(xs.size, floe.xF[-1])), wave, t, EType)
+    EtotsFine = Eels[:xs.size] + Eels[xs.size:] + floe.k
+
+    assert abs(xFracs[0] - xs[np.argmin(EtotsFine)]) <= tol
+    assert Etot == pytest.approx(EtotsFine.min(), rel=1e-3)
+
+
+@pytest.mark.parametrize('multiFrac', [False, True])
+def test_maxFrac_zero_means_no_fracture(multiFrac):
+    EType = 'Flex'
+    floe, wave, t = forcedFloe(0, EType)
+    assert floe.FindE_min(wave, t, EType=EType, multiFrac=multiFrac)[0]
+
+    xFracs, floes, Etot = floe.FindE_min(wave, t, EType=EType, multiFrac=multiFrac, maxFrac=0)
+    assert xFracs == [] and floes == []
+    assert Etot == floe.Eel
+    with pytest.raises(ValueError):
+        floe.FindE_min(wave, t, EType=EType, multiFrac=multiFrac, maxFrac=-1)
+
+    Floes = BreakFloes(np.arange(2 * floe.x0 + floe.L), t, [floe], wave, multiFrac, EType, maxFrac=0)
+    assert list(Floes) == [floe]
+
+
+@pytest.mark.parametrize('multiFrac', [False, True])
+def test_FindE_min_after_waves_at_several_times(multiFrac):
+    EType = 'Flex'
+    floe, wave, t = forcedFloe(1, EType)
+    x = np.arange(2 * floe.x0 + floe.L)
+    ts = np.linspace(0, t, 7)
+
+    wave.waves(x, ts[-1], floes=[floe])
+    a0, phi0 = floe.a0, floe.phi0
+    expected = floe.FindE_min(wave, ts[-1], EType=EType, multiFrac=multiFrac)
+
+    # Floes are left with their amplitude and phase at the last time, as after a loop over the times
+    for _ in wave.wavesByChunks(x, ts, chunkSize=3, floes=[floe]):
+        pass
+    assert np.isscalar(floe.a0) and np.isscalar(floe.phi0)
+    assert floe.a0 == pytest.approx(a0, rel=1e-12)
+    assert floe.phi0 == pytest.approx(phi0, rel=1e-12)
+
+    xFracs, floes, Etot = floe.FindE_min(wave, ts[-1], EType=EType, multiFrac=multiFrac)
+    np.testing.assert_allclose(xFracs, expected[0])
+    assert Etot == pytest.approx(expected[2], rel=1e-9)
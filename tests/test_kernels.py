@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Kernels backends (cf FlexKernels), checked against the numpy backend
+"""
+
+import numpy as np
+import pytest
+
+import FlexKernels
+from FlexOperator import bandsToArray, getFlexCache
+from IceDef import Floe
+
+backends = ['numpy', pytest.param('numba', marks=pytest.mark.skipif(not FlexKernels.hasNumba,
+                                                                    reason='numba is not installed'))]
+
+
+def floeResults(L, dx, EType):
+    # Displacement and elastic energy of a floe under a wave, with operators factorized by the current backend
+    getFlexCache().clear()
+    floe = Floe(1, 10, L, DispType='Open', dx=dx)
+    wvf = 0.5 * np.sin(0.3 * floe.xF + 1) * np.exp(-0.01 * (floe.xF - floe.x0))
+    Eel = floe.calc_Eel(wvf=wvf, EType=EType)
+    return floe.w.copy(), Eel
+
+
+@pytest.fixture
+def backend(request):
+    FlexKernels.setBackend(request.param)
+    yield request.param
+    FlexKernels.setBackend('numpy')
+    getFlexCache().clear()
+
+
+@pytest.mark.parametrize('backend', backends, indirect=True)
+@pytest.mark.parametrize('EType', ['Flex', 'Disp'])
+@pytest.mark.parametrize('L, dx', [(80, 0.8), (250, 1)])  # eigenbasis (101 points) and banded solves
+def test_backend_matches_numpy(backend, EType, L, dx):
+    w, Eel = floeResults(L, dx, EType)
+
+    FlexKernels.setBackend('numpy')
+    wRef, EelRef = floeResults(L, dx, EType)
+
+    assert FlexKernels.getKernels().name == 'numpy'
+    np.testing.assert_allclose(w, wRef, rtol=1e-10, atol=1e-14)
+    assert Eel == pytest.approx(EelRef, rel=1e-10)
+
+
+@pytest.mark.parametrize('backend', backends, indirect=True)
+def test_pentaSolve_matches_dense(backend):
+    rng = np.random.default_rng(0)
+    N = 150
+    bands = rng.uniform(-1, 1, (5, N))
+    bands[2] += 6
+    factors, info = FlexKernels.getKernels().pentaFactor(bands)
+    b = rng.normal(size=(N, 3))
+
+    assert info == 0
+    np.testing.assert_allclose(FlexKernels.getKernels().pentaSolve(factors, b),
+                               np.linalg.solve(bandsToArray(bands), b), rtol=1e-10)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Phase and attenuated amplitude of WaveDef.Wave, checked against the floe by floe loops they replace
+"""
+
+import numpy as np
+import pytest
+
+from IceDef import Floe
+from pars import g, rho_w
+from WaveDef import Wave
+
+
+def loopPhase(wave, x, t, floes):
+    # Phase over the domain, computed one floe at a time (original Wave.calc_phase)
+    phase = wave.k * x - wave.omega * t + wave.phi
+    phi0s = []
+    for floe in floes:
+        ind = np.where(x <= floe.x0)[0][-2:]
+        phip = phase[ind]
+        xp = x[ind]
+        phi0 = phip[0] + (floe.x0 - xp[0]) * (phip[1] - phip[0]) / (xp[1] - xp[0])
+        phi0s.append(phi0)
+
+        ind = (x >= floe.x0) * (x <= floe.x0 + floe.L)
+        phase[ind] = phi0 + floe.kw * (x[ind] - floe.x0)
+        ind = x > floe.x0 + floe.L
+        phase[ind] = phi0 + floe.kw * floe.L + wave.k * (x[ind] - floe.x0 - floe.L)
+    return phase, phi0s
+
+
+def loopAmplitude(wave, x, a0, floes):
+    # Attenuated amplitude over the domain, computed one floe at a time (original Wave.amp_att)
+    def a_att(x, floe, a0, k):
+        E0 = (1 / 8) * rho_w * g * (2 * a0)**2
+        Ex = E0 * np.exp(-floe.calc_alpha(k) * x)
+        return np.sqrt(8 * Ex / (rho_w * g)) / 2
+
+    ax = np.zeros_like(x, dtype=float)
+    ax[x <= floes[0].x0] = a0
+    a0s = []
+    for floe in floes:
+        a0s.append(a0)
+        pFloe = (x >= floe.x0) * (x <= floe.x0 + floe.L)
+        xvec = np.append([floe.x0], np.append(x[pFloe], floe.x0 + floe.L))
+        avec = a_att(xvec - floe.x0, floe, a0, wave.k)
+        ax[pFloe] = avec[1:-1]
+        ax[x > floe.xF[-1]] = avec[-1]
+        a0 = avec[-1]
+    return ax, a0s
+
+
+def floeLayout(layout, seed):
+    # Floes from left to right, with open water between them, touching, or some shorter than the grid spacing
+    rng = np.random.default_rng(seed)
+    if layout == 'gaps':
+        Ls = rng.uniform(5, 40, 6)
+        gaps = rng.uniform(0.3, 10, 6)
+    elif layout == 'touching':
+        Ls = rng.uniform(5, 40, 6)
+        gaps = np.zeros(6)
+    elif layout == 'short':
+        Ls = rng.uniform(0.2, 3, 6)
+        gaps = np.concatenate([[5], np.zeros(5)])
+    x0s = 10.3 + np.cumsum(gaps) + np.concatenate([[0], np.cumsum(Ls[:-1])])
+
+    floes = []
+    for x0, L in zip(x0s, Ls):
+        floe = Floe(1, x0, L, DispType='Open')
+        floe.kw = rng.uniform(0.1, 0.4)
+        floes.append(floe)
+    return floes
+
+
+def gridWithEdges(floes):
+    # Regular grid over the domain, with points on the edges of the floes as well
+    return np.unique(np.concatenate([np.arange(0, floes[-1].x0 + floes[-1].L + 20, 0.7),
+                                     [floe.x0 for floe in floes], [floe.x0 + floe.L for floe in floes]]))
+
+
+@pytest.mark.parametrize('layout', ['gaps', 'touching', 'short'])
+@pytest.mark.parametrize('seed', range(3))
+def test_calc_phase_matches_loop(layout, seed):
+    floes = floeLayout(layout, seed)
+    wave = Wave(0.5, 25, phi=1.3)
+    x = gridWithEdges(floes)
+    t = 4.2
+
+    phaseRef, phi0sRef = loopPhase(wave, x, t, floes)
+    phase = wave.calc_phase(x, t, floes=floes)
+
+    np.testing.assert_allclose(phase, phaseRef, rtol=1e-12, atol=1e-10)
+    np.testing.assert_allclose([floe.phi0 for floe in floes], phi0sRef, rtol=1e-12, atol=1e-10)
+
+    # Several times at once
+    ts = np.array([0, 1.7, t])
+    phases = wave.calc_phase(x, ts, floes=floes)
+    for it in range(len(ts)):
+        np.testing.assert_allclose(phases[it], loopPhase(wave, x, ts[it], floes)[0], rtol=1e-12, atol=1e-10)
+
+
+@pytest.mark.parametrize('layout', ['gaps', 'touching', 'short'])
+@pytest.mark.parametrize('seed', range(3))
+def test_amp_att_matches_loop(layout, seed):
+    floes = floeLayout(layout, seed)
+    wave = Wave(0.5, 25)
+    x = gridWithEdges(floes)
+
+    axRef, a0sRef = loopAmplitude(wave, x, 0.5, floes)
+    ax = wave.amp_att(x, 0.5, floes)
+
+    np.testing.assert_allclose(ax, axRef, rtol=1e-12, atol=1e-14)
+    np.testing.assert_allclose([floe.a0 for floe in floes], a0sRef, rtol=1e-12)
+
+    # Several input amplitudes at once
+    a0s = np.array([0.1, 0.5, 2])
+    axs = wave.amp_att(x, a0s, floes)
+    for ia, a0 in enumerate(a0s):
+        np.testing.assert_allclose(axs[ia], loopAmplitude(wave, x, a0, floes)[0], rtol=1e-12, atol=1e-14)
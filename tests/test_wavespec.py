@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Spectral waves of WaveSpecDef.WaveSpec, checked against the frequency by frequency
+and floe by floe computations they replace
+"""
+
+import numpy as np
+import pytest
+from scipy import interpolate
+
+from EnvelopeStore import EnvelopeStore
+from IceDef import Floe
+from WaveSpecDef import PhasorLookup, WaveSpec
+
+
+def loopEnvelope(spec, x, t, floes):
+    # Wave energy and amplitudes, one frequency and one floe at a time (original WaveSpec.calcExt)
+    x0 = floes[0].x0 if len(floes) > 0 else x[-1]
+    xw = spec.cgw * t
+    Ex = np.zeros([len(spec.f), len(x)])
+    Ex[:, 0] = spec.Ei
+    amps = np.empty_like(Ex)
+
+    for iF in range(len(spec.f)):
+        Ex[iF, x <= min([xw[iF], x0])] = spec.Ei[iF]
+
+        if len(floes) > 0:
+            t_prop = floes[0].x0 / spec.cgw[iF]
+            last = True
+            if t > t_prop:
+                for ifloe, floe in enumerate(floes):
+                    k = floe.kw[iF]
+                    cg = floe.cg[iF]
+                    x_prop = cg * (t - t_prop)
+                    if x_prop < floe.L:
+                        ind = (x >= floe.x0) * (x <= floe.x0 + x_prop)
+                        last = True
+                        if sum(ind) == 0:
+                            break
+                    else:
+                        ind = (x >= floe.x0) * (x <= floe.x0 + floe.L)
+                        t_prop += min([x_prop, floe.L]) / cg
+                        last = False
+
+                    alpha = floe.alpha[iF]
+                    if ifloe == 0:
+                        E0 = Ex[iF, x <= floe.x0][-1]
+                    else:
+                        indL = np.where(x <= floe.x0)[0][-1]
+                        dx = floe.x0 - x[indL]
+                        alpha_p = (1 / 2) * floes[ifloe - 1].h * k**2
+                        E0 = Ex[iF, indL] * np.exp(-alpha_p * dx)
+                    Ex[iF, ind] = E0 * np.exp(-alpha * (x[ind] - floe.x0))
+                    if last:
+                        break
+
+            if not last and t > t_prop:
+                indL = np.where(ind)[0][-1]
+                x_prop = spec.cgw[iF] * (t - t_prop)
+                ind = (x > floe.x0 + floe.L) * (x <= floe.x0 + floe.L + x_prop)
+                Ex[iF, ind] = Ex[iF, indL]
+
+        amp = (2 * Ex[iF, :] * spec.df[iF]) ** 0.5
+        iax = amp > 0
+        if iax.sum() < len(iax) and iax.sum() > 0:
+            indL = np.where(iax)[0][-1]
+            ia0 = np.invert(iax)
+            amp[ia0] = amp[indL] * np.exp(-(1 / spec.tail_fac) * spec.k[iF] * (x[ia0] - x[indL]))
+        amps[iF] = amp
+    return Ex, amps
+
+
+def iceLayout(layout, spec, seed):
+    # Floes from left to right, with open water between them, touching, or some shorter than the grid spacing
+    rng = np.random.default_rng(seed)
+    if layout == 'water':
+        return []
+    elif layout == 'gaps':
+        Ls = rng.uniform(10, 60, 5)
+        gaps = rng.uniform(0.5, 15, 5)
+    elif layout == 'touching':
+        Ls = rng.uniform(10, 60, 5)
+        gaps = np.zeros(5)
+    elif layout == 'short':
+        Ls = np.concatenate([rng.uniform(0.2, 1.5, 4), [30]])
+        gaps = np.concatenate([[3], np.zeros(4)])
+    x0s = 100.3 + np.cumsum(gaps) + np.concatenate([[0], np.cumsum(Ls[:-1])])
+
+    floes = []
+    for x0, L, h in zip(x0s, Ls, rng.choice([0.5, 1], len(Ls))):
+        floe = Floe(h, x0, L)
+        floe.setWPars(spec)
+        floes.append(floe)
+    return floes
+
+
+@pytest.mark.parametrize('layout', ['water', 'gaps', 'touching', 'short'])
+@pytest.mark.parametrize('seed', range(2))
+def test_calcExt_matches_loop(layout, seed):
+    spec = WaveSpec(Hs=1.5, Tp=7, spec='JONSWAP', phi=np.zeros(21))
+    floes = iceLayout(layout, spec, seed)
+    x = np.arange(0, 500, 0.9)
+
+    # Before the waves reach the ice, within the ice, and after they got through it
+    for t in [5, 25, 60, 200]:
+        ExRef, ampsRef = loopEnvelope(spec, x, t, floes)
+        if len(floes) > 0:
+            spec.calcExt(x, t, floes)
+        else:
+            spec.calcExt(x, t)
+
+        np.testing.assert_allclose(spec.Ex, ExRef, rtol=1e-12, atol=1e-300)
+        np.testing.assert_allclose(spec.af.values, ampsRef, rtol=1e-12, atol=1e-300)
+
+
+def spectralWaves(seed, interp='quadratic'):
+    # Spectrum with random phases, its energy and phases set at a random time over ice
+    rng = np.random.default_rng(seed)
+    spec = WaveSpec(Hs=1.5, Tp=7, spec='JONSWAP', phi=rng.uniform(0, 2 * np.pi, 21), interp=interp)
+    floes = iceLayout('touching', spec, seed)
+    x = np.arange(0, 500, 0.9)
+    t = rng.uniform(30, 80)
+    spec.calcExt(x, t, floes)
+    spec.set_phases(x, t, floes)
+    return spec, floes, x, t
+
+
+@pytest.mark.parametrize('seed', range(2))
+def test_synthesis_matches_interp1d(seed):
+    spec, _, x, _ = spectralWaves(seed)
+    xq = np.random.default_rng(seed).uniform(x[0], x[-1], 300)
+
+    wvfield = np.zeros_like(xq)
+    for iF in range(spec.nf):
+        amp = interpolate.interp1d(x, spec.af.values[iF], kind='quadratic')(xq)
+        np.testing.assert_allclose(spec.af(xq)[iF], amp, rtol=1e-9, atol=1e-12)
+        wvfield += amp * np.sin(interpolate.interp1d(x, spec.phif.values[iF])(xq))
+
+    np.testing.assert_allclose(spec.calc_waves(xq), wvfield, rtol=1e-9, atol=1e-12)
+
+
+def test_field_cache_follows_waves():
+    spec, floes, x, t = spectralWaves(0)
+    xs = [floe.xF for floe in floes]
+
+    wvfield = spec.calc_waves(xs[0])
+    assert not wvfield.flags.writeable
+    assert spec.calc_waves(xs[0]) is wvfield
+    assert spec.calc_wavesSets(xs)[0] is wvfield
+
+    # New phases, then new energy: the cached fields are computed again
+    for update in [lambda: spec.set_phases(x, t + 1.3, floes), lambda: spec.calcExt(x, t + 1.3, floes)]:
+        update()
+        assert len(spec.fieldCache) == 0
+        wvfieldNew = spec.calc_waves(xs[0])
+        assert not np.allclose(wvfieldNew, wvfield)
+        np.testing.assert_array_equal(wvfieldNew, spec.synthesis(xs[0]))
+        for x1, wvfield1 in zip(xs, spec.calc_wavesSets(xs)):
+            np.testing.assert_array_equal(wvfield1, spec.synthesis(x1))
+        wvfield = wvfieldNew
+
+
+@pytest.mark.parametrize('invariant', [False, True])
+def test_envelopes_replay_calcEnvelope(invariant, tmp_path):
+    store = EnvelopeStore(directory=str(tmp_path))
+    x = np.arange(0, 500, 0.9)
+    times = [5, 25, 60]
+    floes = iceLayout('touching', WaveSpec(), 0)
+    # The same ice, fractured: the floes on the left of the fracture are unchanged
+    fractured = floes[:2] + floes[2].fracture(floes[2].x0 + floes[2].L / 3) + floes[3:]
+
+    # Repeats of an experiment, with other phases
+    for repeat in range(2):
+        spec = WaveSpec(Hs=1.5, Tp=7, spec='JONSWAP', phi=np.random.default_rng(repeat).uniform(0, 6, 21))
+        spec.useEnvelopes(store, invariant=invariant)
+        for t in times:
+            spec.calcExt(x, t, floes)
+            np.testing.assert_array_equal(spec.Ex, spec.calcEnvelope(x, t, spec.iceArrays(floes, merge=invariant)))
+    assert store.hits == len(times) and store.misses == len(times)
+
+    for floe in fractured:
+        floe.setWPars(spec)
+    spec.calcExt(x, times[-1], fractured)
+    if invariant:
+        # Replayed for the same ice extent, as if the ice had not fractured
+        assert store.hits == len(times) + 1
+        np.testing.assert_array_equal(spec.Ex, spec.calcEnvelope(x, times[-1], spec.iceArrays(floes, merge=True)))
+    else:
+        assert store.misses == len(times) + 1
+        np.testing.assert_array_equal(spec.Ex, spec.calcEnvelope(x, times[-1], spec.iceArrays(fractured)))
+
+
+def test_phasors_match_phases():
+    rng = np.random.default_rng(3)
+    phi = rng.uniform(0, 2 * np.pi, 21)
+    specs = [WaveSpec(Hs=1.5, Tp=7, spec='JONSWAP', phi=phi, phasors=phasors) for phasors in [False, True]]
+    floes = iceLayout('gaps', specs[0], 3)
+    x = np.arange(0, 500, 0.9)
+
+    # Several time steps, the last ones after a fracture
+    for it, t in enumerate(np.arange(30, 40, 1.3)):
+        if it == 4:
+            floes = floes[:1] + floes[1].fracture(floes[1].x0 + floes[1].L / 2) + floes[2:]
+            for floe in floes:
+                floe.setWPars(specs[0])
+        xs = [floe.xF for floe in floes]
+        wvfields = []
+        for spec in specs:
+            spec.calcExt(x, t, floes)
+            spec.set_phases(x, t, floes)
+            wvfields.append((spec.calc_waves(xs[0]), spec.calc_wavesSets(xs)))
+        np.testing.assert_allclose(wvfields[1][0], wvfields[0][0], rtol=1e-9, atol=1e-12)
+        for wvfield1, wvfield0 in zip(wvfields[1][1], wvfields[0][1]):
+            np.testing.assert_allclose(wvfield1, wvfield0, rtol=1e-9, atol=1e-12)
+
+
+def test_phasors_bounded():
+    spec, floes, x, t = spectralWaves(1)
+    omega = np.array([wave.omega for wave in spec.waves])
+    phif = PhasorLookup(x, spec.phif.values, omega, t, None, maxbytes=3 * spec.nf * 101 * 16)
+
+    xs = [floe.xF[:101] for floe in floes]
+    assert len(xs) > 3
+    for xF in xs:
+        phif.basis(xF)
+    assert len(phif.bases) == 3
+    assert phif.nbytes == sum(phasors.nbytes for phasors in phif.bases.values()) <= phif.maxbytes
+    # Sets larger than the bound are not kept
+    phif.basis(np.concatenate(xs))
+    assert len(phif.bases) == 3
+    # The least recently used sets are dropped first
+    phif.basis(xs[2])
+    phif.basis(xs[0])
+    assert [key[1] for key in phif.bases] == [xs[iF].tobytes() for iF in [-1, 2, 0]]
+
+
+def test_keptBins_after_two_truncations():
+    spec = WaveSpec(Hs=1.5, Tp=7, spec='JONSWAP', phi=np.zeros(21))
+    fFull = spec.f.copy()
+    removed = [spec.truncate(tol, weight=weight)['removed'] for tol, weight in [(1e-3, 'energy'), (1e-2, 'strain')]]
+    assert min(removed) > 0
+
+    # Phases of the repeats, one column per repeat (cf pars.phi0), with more rows than frequencies
+    phi = np.arange(2 * len(fFull) * 3).reshape(2 * len(fFull), 3)
+    iKept = np.searchsorted(fFull, spec.f)
+    np.testing.assert_array_equal(fFull[iKept], spec.f)
+    np.testing.assert_array_equal(spec.keptBins(fFull), spec.f)
+    for iL in range(phi.shape[1]):
+        np.testing.assert_array_equal(spec.keptBins(phi[:, iL]), phi[iKept, iL])
+
+
+@pytest.mark.parametrize('weight', ['energy', 'strain', 'both'])
+def test_truncate_merge_conserves_energy(weight):
+    spec = WaveSpec(Hs=1.5, Tp=7, spec='JONSWAP', phi=np.zeros(21))
+    E, Hs = spec.calcE(), spec.calcHs()
+    for tol in [1e-3, 1e-2]:
+        report = spec.truncate(tol, weight=weight, merge=True)
+        assert report['removed'] > 0
+        assert spec.calcE() == pytest.approx(E, rel=1e-12)
+        assert spec.calcHs() == pytest.approx(Hs, rel=1e-12)
+
+
+@pytest.mark.parametrize('SpecType', ['JONSWAP', 'PM', 'PowerLaw'])
+@pytest.mark.parametrize('tol', [1e-4, 1e-3, 1e-2, 1e-1])
+def test_truncate_both_within_tol(SpecType, tol):
+    spec = WaveSpec(Hs=1.5, Tp=7, spec=SpecType, phi=np.zeros(21), n=-3)
+    E = spec.Ei * spec.df
+    strain = spec.k**4 * E
+    report = spec.truncate(tol, weight='both')
+
+    assert report['energy'] <= tol and report['strain'] <= tol
+    removed = np.invert(spec.keep)
+    assert E[removed].sum() <= tol * E.sum()
+    assert strain[removed].sum() <= tol * strain.sum()